@@ -10,53 +10,153 @@ import struct
 import ssl
 import base64
 import random
+import secrets
 import time
 import json
 import os
-from typing import Optional, Tuple, List
+import re
+import ipaddress
+from typing import Dict, Optional, Tuple, List
 import logging
 import aiohttp
 from cryptography.fernet import Fernet
 
+try:
+    import aiodns  # noqa: F401 - enables aiohttp.AsyncResolver
+    _Resolver = aiohttp.AsyncResolver
+except ImportError:
+    _Resolver = aiohttp.ThreadedResolver
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Fixed SOCKS5 frames and precompiled layouts
+_HANDSHAKE = b'\x05\x01\x02'  # Version 5, 1 method, username/password
+_CONNECT_HDR = b'\x05\x01\x00\x03'  # Version, connect, reserved, domain name type
+_H = struct.Struct('!H')
+
+# TLS context shared by every TLS-capable attempt; building one per
+# request re-reads the system CA store. aiohttp only speaks HTTP/1.1.
+_SSL_CTX = ssl.create_default_context()
+_SSL_CTX.set_alpn_protocols(['http/1.1'])
+
+# Jitter source for traffic shaping delays
+_sysrandom = secrets.SystemRandom()
+
+# Dotted-quad candidates in connection info files
+_IP_RE = re.compile(r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b')
+
 class ExternalBypassClient:
     """External client for bypass methods when main proxy is blocked"""
     
+    # Connection methods in order of preference
+    _METHOD_NAMES = (
+        '_connect_via_port_hop',
+        '_connect_via_http_tunnel',
+        '_connect_via_websocket',
+        '_connect_via_domain_fronting'
+    )
+    
     def __init__(self, server_ip: str = None, 
                  username: str = 'admin', password: str = None):
         self.server_ip = server_ip
         self.username = username
         self.password = password
         
+        # Credentials encoded once for every SOCKS5 auth
+        self._user_bytes = username.encode('utf-8')
+        self._pass_bytes = password.encode('utf-8') if password else b''
+        
         # Bypass method ports
         self.http_tunnel_port = 8443
         self.websocket_port = 8444
         self.port_hop_range = (8000, 9000)
+        self.max_parallel_probes = 20
+        
+        # Domain fronting
+        self.fronting_domains = ('cloudflare.com', 'amazonaws.com', 'googleapis.com')
+        self._fronting_delay = _sysrandom.uniform(0.5, 2.0)
+        
+        # Per-attempt deadlines so a blocked method falls through quickly
+        self.per_method_timeout = 5.0
+        self.connect_timeout = 3.0
+        self.http_timeout = 3.0
+        
+        # Port hopping fetches /port-info, then races the advertised ports
+        # and, if those are dead, a round of random ports; budget for all three
+        self.port_hop_timeout = self.http_timeout + 2 * self.connect_timeout + 1.0
         
-        # Connection methods in order of preference
-        self.connection_methods = [
-            self._connect_via_port_hop,
-            self._connect_via_http_tunnel,
-            self._connect_via_websocket,
-            self._connect_via_domain_fronting
-        ]
+        # Shared HTTP session, created lazily on first use
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        # Server address resolved once for all proxy connects
+        self._resolved_ip: Optional[str] = None
+        
+        # Last /port-info answer as (monotonic timestamp, info)
+        self._port_info_cache: Optional[Tuple[float, Dict]] = None
+        self._port_info_ttl = 15.0
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it if needed"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=100, keepalive_timeout=75,
+                    resolver=_Resolver(), use_dns_cache=True, ttl_dns_cache=300,
+                    family=socket.AF_INET, ssl=_SSL_CTX
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.http_timeout)
+            )
+        return self._session
+    
+    async def _resolve_server_ip(self) -> str:
+        """Resolve the server address once and reuse it afterwards"""
+        if self._resolved_ip is None:
+            try:
+                ipaddress.ip_address(self.server_ip)
+                self._resolved_ip = self.server_ip
+            except ValueError:
+                infos = await asyncio.get_running_loop().getaddrinfo(
+                    self.server_ip, None, family=socket.AF_INET, type=socket.SOCK_STREAM
+                )
+                self._resolved_ip = infos[0][4][0]
+        return self._resolved_ip
+    
+    async def aclose(self):
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     async def connect_with_fallback(self, target_host: str, target_port: int) -> Optional[Tuple]:
         """Try to connect using bypass methods"""
         logger.info(f"Attempting bypass connection to {target_host}:{target_port}")
         logger.info(f"Server: {self.server_ip}")
         
-        for i, method in enumerate(self.connection_methods):
+        method_count = len(self._METHOD_NAMES)
+        for i, name in enumerate(self._METHOD_NAMES):
+            method = getattr(self, name)
             try:
-                logger.info(f"Trying method {i+1}/{len(self.connection_methods)}: {method.__name__}")
-                reader, writer = await method(target_host, target_port)
-                logger.info(f"Successfully connected via {method.__name__}")
+                logger.info(f"Trying method {i+1}/{method_count}: {name}")
+                if name == '_connect_via_port_hop':
+                    timeout = self.port_hop_timeout
+                else:
+                    timeout = self.per_method_timeout
+                reader, writer = await asyncio.wait_for(
+                    method(target_host, target_port),
+                    timeout=timeout
+                )
+                logger.info(f"Successfully connected via {name}")
                 return reader, writer
             except Exception as e:
-                logger.warning(f"Method {method.__name__} failed: {e}")
+                logger.warning(f"Method {name} failed: {e!r}")
                 continue
         
         logger.error("All bypass methods failed")
@@ -64,83 +164,116 @@ class ExternalBypassClient:
     
     async def _connect_via_port_hop(self, target_host: str, target_port: int) -> Tuple:
         """Connect via port hopping"""
+        candidate_ports = []
+        
         # Get current active port from bypass server
+        port_info = await self._get_port_info()
+        if port_info:
+            current_port = port_info.get('current_port')
+            active_ports = port_info.get('active_ports', [])
+            
+            logger.info(f"Current active port: {current_port}")
+            logger.info(f"Active ports: {active_ports}")
+            
+            if current_port:
+                candidate_ports.append(current_port)
+            candidate_ports.extend(port for port in active_ports if port != current_port)
+        
+        # Probe all advertised ports at once
+        if candidate_ports:
+            connection = await self._race_socks5_connect(candidate_ports, target_host, target_port)
+            if connection:
+                return connection
+            # Advertised ports are dead, the server has probably hopped
+            self._port_info_cache = None
+        
+        # Fallback to random port attempts
+        low, high = self.port_hop_range
+        random_ports = random.sample(range(low, high + 1), 10)
+        connection = await self._race_socks5_connect(random_ports, target_host, target_port)
+        if connection:
+            return connection
+        
+        raise Exception("No active port hop found")
+    
+    async def _get_port_info(self) -> Optional[Dict]:
+        """Fetch port hopping info, reusing a recent answer if still fresh"""
+        if self._port_info_cache is not None:
+            fetched_at, port_info = self._port_info_cache
+            if time.monotonic() - fetched_at < self._port_info_ttl:
+                return port_info
+        
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"http://{self.server_ip}:{self.http_tunnel_port}/port-info") as response:
-                    if response.status == 200:
-                        port_info = await response.json()
-                        current_port = port_info.get('current_port')
-                        active_ports = port_info.get('active_ports', [])
-                        
-                        logger.info(f"Current active port: {current_port}")
-                        logger.info(f"Active ports: {active_ports}")
-                        
-                        # Try current port first
-                        if current_port:
-                            try:
-                                return await self._socks5_connect(
-                                    self.server_ip, current_port,
-                                    target_host, target_port,
-                                    self.username, self.password
-                                )
-                            except Exception as e:
-                                logger.debug(f"Current port {current_port} failed: {e}")
-                        
-                        # Try other active ports
-                        for port in active_ports:
-                            if port != current_port:
-                                try:
-                                    return await self._socks5_connect(
-                                        self.server_ip, port,
-                                        target_host, target_port,
-                                        self.username, self.password
-                                    )
-                                except Exception as e:
-                                    logger.debug(f"Port {port} failed: {e}")
-                                    continue
+            session = await self._get_session()
+            async with session.get(f"http://{self.server_ip}:{self.http_tunnel_port}/port-info") as response:
+                if response.status == 200:
+                    port_info = await response.json()
+                    self._port_info_cache = (time.monotonic(), port_info)
+                    return port_info
         except Exception as e:
             logger.debug(f"Failed to get port info: {e}")
         
-        # Fallback to random port attempts
-        for _ in range(10):  # Try up to 10 random ports
-            hop_port = random.randint(*self.port_hop_range)
-            try:
+        return None
+    
+    async def _race_socks5_connect(self, ports: List[int], target_host: str,
+                                   target_port: int) -> Optional[Tuple]:
+        """Probe ports concurrently and return the first successful connection"""
+        semaphore = asyncio.Semaphore(self.max_parallel_probes)
+        
+        async def probe(port):
+            async with semaphore:
                 return await self._socks5_connect(
-                    self.server_ip, hop_port,
-                    target_host, target_port,
-                    self.username, self.password
+                    self.server_ip, port,
+                    target_host, target_port
                 )
-            except:
-                continue
         
-        raise Exception("No active port hop found")
+        pending = {asyncio.create_task(probe(port)) for port in ports}
+        winner = None
+        
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        logger.debug(f"Port hop probe failed: {task.exception()}")
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        task.result()[1].close()
+        finally:
+            # Cancel the losers and close any connection that slipped through
+            for task in pending:
+                task.cancel()
+            for result in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(result, tuple):
+                    result[1].close()
+        
+        return winner
     
     async def _connect_via_http_tunnel(self, target_host: str, target_port: int) -> Tuple:
         """Connect via HTTP tunnel (looks like web traffic)"""
         try:
             # Test HTTP tunnel endpoint
-            async with aiohttp.ClientSession() as session:
-                test_data = b"test_connection"
-                async with session.post(
-                    f"http://{self.server_ip}:{self.http_tunnel_port}/tunnel",
-                    data=test_data,
-                    headers={
-                        'Content-Type': 'application/octet-stream',
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                    }
-                ) as response:
-                    if response.status == 200:
-                        logger.info("HTTP tunnel endpoint is accessible")
-                        # For now, create a direct connection as fallback
-                        # In production, this would implement full HTTP tunneling
-                        return await self._socks5_connect(
-                            self.server_ip, self.http_tunnel_port,
-                            target_host, target_port,
-                            self.username, self.password
-                        )
-                    else:
-                        raise Exception(f"HTTP tunnel failed: {response.status}")
+            session = await self._get_session()
+            test_data = b"test_connection"
+            async with session.post(
+                f"http://{self.server_ip}:{self.http_tunnel_port}/tunnel",
+                data=test_data,
+                headers={
+                    'Content-Type': 'application/octet-stream',
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                }
+            ) as response:
+                if response.status == 200:
+                    logger.info("HTTP tunnel endpoint is accessible")
+                    # For now, create a direct connection as fallback
+                    # In production, this would implement full HTTP tunneling
+                    return await self._socks5_connect(
+                        self.server_ip, self.http_tunnel_port,
+                        target_host, target_port
+                    )
+                else:
+                    raise Exception(f"HTTP tunnel failed: {response.status}")
         except Exception as e:
             raise Exception(f"HTTP tunnel connection failed: {e}")
     
@@ -148,152 +281,156 @@ class ExternalBypassClient:
         """Connect via WebSocket tunnel (looks like chat app)"""
         try:
             # Test WebSocket endpoint
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"http://{self.server_ip}:{self.websocket_port}/") as response:
-                    if response.status == 200:
-                        logger.info("WebSocket tunnel endpoint is accessible")
-                        # For now, create a direct connection as fallback
-                        # In production, this would implement full WebSocket tunneling
-                        return await self._socks5_connect(
-                            self.server_ip, self.websocket_port,
-                            target_host, target_port,
-                            self.username, self.password
-                        )
-                    else:
-                        raise Exception(f"WebSocket endpoint failed: {response.status}")
+            session = await self._get_session()
+            async with session.get(f"http://{self.server_ip}:{self.websocket_port}/") as response:
+                if response.status == 200:
+                    logger.info("WebSocket tunnel endpoint is accessible")
+                    # For now, create a direct connection as fallback
+                    # In production, this would implement full WebSocket tunneling
+                    return await self._socks5_connect(
+                        self.server_ip, self.websocket_port,
+                        target_host, target_port
+                    )
+                else:
+                    raise Exception(f"WebSocket endpoint failed: {response.status}")
         except Exception as e:
             raise Exception(f"WebSocket connection failed: {e}")
     
     async def _connect_via_domain_fronting(self, target_host: str, target_port: int) -> Tuple:
         """Connect via domain fronting (via CDN)"""
-        fronting_domains = [
-            'cloudflare.com',
-            'amazonaws.com',
-            'googleapis.com'
-        ]
+        # This is a simplified implementation
+        # In production, this would implement proper domain fronting and
+        # race one attempt per front. For now every front lands on the same
+        # main port, so a single attempt covers them all.
+        logger.info(f"Attempting domain fronting via {', '.join(self.fronting_domains)}")
         
-        for domain in fronting_domains:
-            try:
-                # This is a simplified implementation
-                # In production, this would implement proper domain fronting
-                logger.info(f"Attempting domain fronting via {domain}")
-                
-                # For now, try a direct connection with random delay
-                await asyncio.sleep(random.uniform(0.5, 2.0))
-                
-                return await self._socks5_connect(
-                    self.server_ip, 1081,  # Try main port via fronting
-                    target_host, target_port,
-                    self.username, self.password
-                )
-            except Exception as e:
-                logger.debug(f"Domain fronting via {domain} failed: {e}")
-                continue
+        # Shape traffic with one randomized delay instead of one per front
+        await asyncio.sleep(self._fronting_delay)
         
-        raise Exception("Domain fronting failed")
+        try:
+            return await self._socks5_connect(
+                self.server_ip, 1081,  # Try main port via fronting
+                target_host, target_port
+            )
+        except Exception as e:
+            raise Exception(f"Domain fronting failed: {e}")
+    
+    async def _read_connect_reply(self, reader: asyncio.StreamReader) -> Tuple[int, int]:
+        """Read a CONNECT reply, sized by its address type; returns (version, code)"""
+        version, code, _, address_type = await reader.readexactly(4)
+        if address_type == 1:  # IPv4
+            remaining = 4 + 2
+        elif address_type == 3:  # Domain name
+            remaining = (await reader.readexactly(1))[0] + 2
+        elif address_type == 4:  # IPv6
+            remaining = 16 + 2
+        else:
+            raise Exception(f"Invalid address type in reply: {address_type}")
+        await reader.readexactly(remaining)
+        return version, code
     
     async def _socks5_connect(self, proxy_host: str, proxy_port: int,
-                             target_host: str, target_port: int,
-                             username: str, password: str) -> Tuple:
+                             target_host: str, target_port: int) -> Tuple:
         """Standard SOCKS5 connection"""
-        reader, writer = await asyncio.open_connection(proxy_host, proxy_port)
+        if proxy_host == self.server_ip:
+            proxy_host = await self._resolve_server_ip()
+        
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(proxy_host, proxy_port),
+            timeout=self.connect_timeout
+        )
+        
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         
         try:
             # SOCKS5 handshake
-            handshake = struct.pack('!BBB', 5, 1, 2)  # Version 5, 1 method, username/password
-            writer.write(handshake)
+            writer.write(_HANDSHAKE)
             await writer.drain()
             
-            response = await reader.read(2)
-            if len(response) != 2:
-                raise Exception("Invalid handshake response")
-            
-            version, method = struct.unpack('!BB', response)
+            response = await reader.readexactly(2)
+            version, method = response[0], response[1]
             if version != 5 or method != 2:
                 raise Exception("SOCKS5 handshake failed")
             
-            # Authentication
-            auth_request = struct.pack('!BB', 1, len(username)) + username.encode()
-            auth_request += struct.pack('!B', len(password)) + password.encode()
-            
-            writer.write(auth_request)
+            # Authentication and connect request go out together so the
+            # connect request does not wait for the auth round-trip
+            host_bytes = target_host.encode()
+            buf = bytearray(b'\x01')
+            buf.append(len(self._user_bytes))
+            buf += self._user_bytes
+            buf.append(len(self._pass_bytes))
+            buf += self._pass_bytes
+            buf += _CONNECT_HDR
+            buf.append(len(host_bytes))
+            buf += host_bytes
+            buf += _H.pack(target_port)
+            writer.write(buf)
             await writer.drain()
             
-            auth_response = await reader.read(2)
-            if len(auth_response) != 2:
-                raise Exception("Invalid auth response")
-            
-            auth_version, auth_status = struct.unpack('!BB', auth_response)
+            auth_response = await reader.readexactly(2)
+            auth_version, auth_status = auth_response[0], auth_response[1]
             if auth_status != 0:
                 raise Exception("Authentication failed")
             
-            # Connect request
-            request = struct.pack('!BBB', 5, 1, 0)  # Version, connect, reserved
-            request += struct.pack('!B', 3)  # Domain name type
-            request += struct.pack('!B', len(target_host)) + target_host.encode()
-            request += struct.pack('!H', target_port)
-            
-            writer.write(request)
-            await writer.drain()
-            
-            connect_response = await reader.read(10)
-            if len(connect_response) < 10:
-                raise Exception("Invalid connect response")
-            
-            response_version, response_code = struct.unpack('!BB', connect_response[:2])
+            response_version, response_code = await self._read_connect_reply(reader)
             if response_version != 5 or response_code != 0:
                 raise Exception(f"SOCKS5 connect failed: {response_code}")
             
             return reader, writer
         
+        except asyncio.IncompleteReadError as e:
+            writer.close()
+            raise Exception(f"Proxy closed connection during SOCKS5 negotiation ({len(e.partial)} of {e.expected} bytes)")
         except Exception as e:
             writer.close()
             raise e
 
+def _find_public_ip(text: str) -> Optional[str]:
+    """Return the first public IPv4 address found in text"""
+    for match in _IP_RE.finditer(text):
+        try:
+            if ipaddress.ip_address(match.group()).is_global:
+                return match.group()
+        except ValueError:
+            continue
+    return None
+
 def load_client_config():
     """Load client configuration from environment or config files"""
-    import os
-    import re
-    
     server_ip = os.getenv('PROXY_SERVER_IP')
     password = os.getenv('PROXY_PASSWORD')
     
     # Try to detect from config files
-    if not server_ip or not password:
-        config_files = ['config/proxy.env', 'proxy.env', '.env']
-        for config_file in config_files:
+    if not password:
+        for config_file in ('config/proxy.env', 'proxy.env', '.env'):
             try:
-                if os.path.exists(config_file):
-                    with open(config_file, 'r') as f:
-                        for line in f:
-                            line = line.strip()
-                            if line and not line.startswith('#') and '=' in line:
-                                key, value = line.split('=', 1)
-                                if key.strip() == 'ADMIN_PASSWORD' and not password:
-                                    password = value.strip()
-                    break
-            except Exception:
+                with open(config_file, 'r', buffering=8192) as f:
+                    for line in f:
+                        line = line.strip()
+                        if line and not line.startswith('#') and '=' in line:
+                            key, value = line.split('=', 1)
+                            if key.strip() == 'ADMIN_PASSWORD':
+                                password = value.strip()
+                                break
+            except (OSError, UnicodeDecodeError):
                 continue
+            break
     
     # Try to auto-detect server IP from connection info
     if not server_ip:
-        info_files = ['connection-info.txt', 'bypass-info.txt']
-        for info_file in info_files:
+        for info_file in ('connection-info.txt', 'bypass-info.txt'):
             try:
-                if os.path.exists(info_file):
-                    with open(info_file, 'r') as f:
-                        content = f.read()
-                        # Look for IP patterns
-                        ip_pattern = r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b'
-                        ips = re.findall(ip_pattern, content)
-                        for ip in ips:
-                            if not ip.startswith('127.') and not ip.startswith('192.168.') and not ip.startswith('10.'):
-                                server_ip = ip
-                                break
+                with open(info_file, 'r', buffering=8192) as f:
+                    for line in f:
+                        server_ip = _find_public_ip(line)
                         if server_ip:
                             break
-            except Exception:
+            except (OSError, UnicodeDecodeError):
                 continue
+            if server_ip:
+                break
     
     # Fallback: prompt user
     if not server_ip:
@@ -328,33 +465,32 @@ async def test_bypass_connection():
     print("Testing bypass methods...")
     print()
     
-    client = ExternalBypassClient(server_ip=server_ip, password=password)
-    
-    # Test connection to Telegram
-    try:
-        connection = await client.connect_with_fallback('api.telegram.org', 443)
-        if connection:
-            reader, writer = connection
-            print(" SUCCESS: Connected via bypass methods!")
-            print(" Your bypass proxy is working!")
-            print()
-            print(" TELEGRAM CONFIGURATION:")
-            print("   Use any bypass method that worked above")
-            print("   The bypass client will automatically connect")
-            print()
-            print(" NEXT STEPS:")
-            print("   1. Save this script on your local computer")
-            print("   2. Run it when main proxy is blocked")
-            print("   3. It will automatically find working bypass method")
-            
-            writer.close()
-            await writer.wait_closed()
-        else:
-            print(" All bypass methods failed")
-            print(" Try running the script again or check server status")
-    except Exception as e:
-        print(f" Bypass connection failed: {e}")
-        print(f" Make sure the bypass server is running on {server_ip}")
+    async with ExternalBypassClient(server_ip=server_ip, password=password) as client:
+        # Test connection to Telegram
+        try:
+            connection = await client.connect_with_fallback('api.telegram.org', 443)
+            if connection:
+                reader, writer = connection
+                print(" SUCCESS: Connected via bypass methods!")
+                print(" Your bypass proxy is working!")
+                print()
+                print(" TELEGRAM CONFIGURATION:")
+                print("   Use any bypass method that worked above")
+                print("   The bypass client will automatically connect")
+                print()
+                print(" NEXT STEPS:")
+                print("   1. Save this script on your local computer")
+                print("   2. Run it when main proxy is blocked")
+                print("   3. It will automatically find working bypass method")
+                
+                writer.close()
+                await writer.wait_closed()
+            else:
+                print(" All bypass methods failed")
+                print(" Try running the script again or check server status")
+        except Exception as e:
+            print(f" Bypass connection failed: {e}")
+            print(f" Make sure the bypass server is running on {server_ip}")
 
 if __name__ == '__main__':
     asyncio.run(test_bypass_connection()) 
\ No newline at end of file
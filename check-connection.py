@@ -3,30 +3,85 @@
 Simple connection checker and info display for Telegram SOCKS5 proxy
 """
 
+import asyncio
+import ipaddress
 import os
+import queue
 import socket
 import subprocess
 import sys
+import threading
+import time
+import urllib.request
+
+# The detected IP is cached on disk, shared with the bypass client in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from ip_cache import read_cached_ip, valid_ip, write_cached_ip
+
+# Public IP detection services, queried concurrently
+IP_DETECTION_URLS = ('http://ifconfig.me/ip', 'http://ipinfo.io/ip', 'http://icanhazip.com')
+IP_DETECTION_TIMEOUT = 5  # seconds
+
+def _fetch_public_ip(url):
+    """Ask a single detection service for our public IP"""
+    with urllib.request.urlopen(url, timeout=IP_DETECTION_TIMEOUT) as response:
+        ip = valid_ip(response.read().decode())
+    if ip and '.' in ip and not ip.startswith(('192.168.', '10.', '172.')):
+        return ip
+    raise ValueError(f"Unusable IP from {url}: {ip!r}")
+
+def _probe_public_ip(url, answers):
+    """Put the IP reported by url on answers, or None if the lookup failed"""
+    try:
+        answers.put(_fetch_public_ip(url))
+    except Exception:
+        answers.put(None)
+
+def _local_ip():
+    """Find the outbound interface address without spawning a process"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            # UDP connect sends nothing, it only selects a route
+            sock.connect(('8.8.8.8', 80))
+            return sock.getsockname()[0]
+    except OSError:
+        return None
 
 def get_server_ip():
     """Get the server's public IP address"""
-    try:
-        # Try multiple IP detection services
-        import urllib.request
-        for url in ['http://ifconfig.me/ip', 'http://ipinfo.io/ip', 'http://icanhazip.com']:
-            try:
-                with urllib.request.urlopen(url, timeout=5) as response:
-                    ip = response.read().decode().strip()
-                    if ip and '.' in ip and not ip.startswith(('192.168.', '10.', '172.')):
-                        return ip
-            except:
-                continue
-    except:
-        pass
+    cached_ip = read_cached_ip()
+    if cached_ip:
+        return cached_ip
+    
+    # Hosts with a public address on the interface need no lookup at all
+    local_ip = _local_ip()
+    if local_ip and ipaddress.ip_address(local_ip).is_global:
+        write_cached_ip(local_ip)
+        return local_ip
+    
+    # Race all detection services and take the first usable answer. The
+    # probes run on daemon threads so slower ones never delay exit.
+    answers = queue.Queue()
+    for url in IP_DETECTION_URLS:
+        threading.Thread(target=_probe_public_ip, args=(url, answers), daemon=True).start()
+    
+    deadline = time.monotonic() + IP_DETECTION_TIMEOUT
+    for _ in IP_DETECTION_URLS:
+        try:
+            ip = answers.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            break
+        if ip:
+            write_cached_ip(ip)
+            return ip
+    
+    # Fallback to the local interface address, then hostname -I
+    if local_ip:
+        return local_ip
     
-    # Fallback to hostname -I for local IP
     try:
-        result = subprocess.run(['hostname', '-I'], capture_output=True, text=True, timeout=5)
+        result = subprocess.run(['hostname', '-I'], stdin=subprocess.DEVNULL,
+                                capture_output=True, text=True, timeout=5)
         if result.returncode == 0:
             ip = result.stdout.strip().split()[0]
             if ip and '.' in ip:
@@ -41,28 +96,28 @@ def load_config():
     config = {}
     config_file = "config/proxy.env"
     
-    if os.path.exists(config_file):
-        with open(config_file, 'r') as f:
+    try:
+        with open(config_file, 'r', buffering=8192) as f:
             for line in f:
                 line = line.strip()
                 if line and not line.startswith('#') and '=' in line:
                     key, value = line.split('=', 1)
                     config[key.strip()] = value.strip()
+    except FileNotFoundError:
+        pass
     
     return config
 
-def check_port_connectivity(host, port):
+async def check_port_connectivity(host, port):
     """Check if port is accessible"""
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(3)
-        result = sock.connect_ex((host, port))
-        sock.close()
-        return result == 0
-    except:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=3.0)
+    except (OSError, asyncio.TimeoutError):
         return False
+    writer.close()
+    return True
 
-def main():
+async def main():
     """Main function to display connection info and check connectivity"""
     
     # Load configuration
@@ -86,65 +141,71 @@ def main():
     
     admin_password = config.get('ADMIN_PASSWORD', 'admin_password_not_found')
     
-    print("")
-    print("╔══════════════════════════════════════════════════════════════════════════════╗")
-    print("║                    TELEGRAM SOCKET5 PROXY - CONNECTION INFO                   ║")
-    print("╚══════════════════════════════════════════════════════════════════════════════╝")
-    print("")
-    print(" YOUR PROXY CONNECTION DETAILS:")
-    print("┌─────────────────────────────────────────────────────────────────────────────┐")
-    print(f"│   Server IP: {server_ip}")
-    print(f"│   Port: {proxy_port}")
-    print(f"│   Username: admin")
-    print(f"│   Password: {admin_password}")
-    print(f"│   Protocol: SOCKET5/SOCKS5")
-    print("└─────────────────────────────────────────────────────────────────────────────┘")
-    print("")
-    
-    # Check connectivity
-    print(" CONNECTION STATUS:")
-    print("┌─────────────────────────────────────────────────────────────────────────────┐")
-    
-    # Check local port
-    local_check = check_port_connectivity('localhost', proxy_port)
-    print(f"│   Local Port {proxy_port}: {'✓ OPEN' if local_check else '✗ CLOSED'}")
-    
-    # Check metrics port
-    metrics_check = check_port_connectivity('localhost', metrics_port)
-    print(f"│   Metrics Port {metrics_port}: {'✓ OPEN' if metrics_check else '✗ CLOSED'}")
-    
-    print("└─────────────────────────────────────────────────────────────────────────────┘")
-    print("")
+    # Check local and metrics ports together
+    local_check, metrics_check = await asyncio.gather(
+        check_port_connectivity('localhost', proxy_port),
+        check_port_connectivity('localhost', metrics_port)
+    )
+    
+    out = []
+    out.append("")
+    out.append("╔══════════════════════════════════════════════════════════════════════════════╗")
+    out.append("║                    TELEGRAM SOCKET5 PROXY - CONNECTION INFO                   ║")
+    out.append("╚══════════════════════════════════════════════════════════════════════════════╝")
+    out.append("")
+    out.append(" YOUR PROXY CONNECTION DETAILS:")
+    out.append("┌─────────────────────────────────────────────────────────────────────────────┐")
+    out.append(f"│   Server IP: {server_ip}")
+    out.append(f"│   Port: {proxy_port}")
+    out.append(f"│   Username: admin")
+    out.append(f"│   Password: {admin_password}")
+    out.append(f"│   Protocol: SOCKET5/SOCKS5")
+    out.append("└─────────────────────────────────────────────────────────────────────────────┘")
+    out.append("")
+    
+    # Connectivity
+    out.append(" CONNECTION STATUS:")
+    out.append("┌─────────────────────────────────────────────────────────────────────────────┐")
+    out.append(f"│   Local Port {proxy_port}: {'✓ OPEN' if local_check else '✗ CLOSED'}")
+    out.append(f"│   Metrics Port {metrics_port}: {'✓ OPEN' if metrics_check else '✗ CLOSED'}")
+    out.append("└─────────────────────────────────────────────────────────────────────────────┘")
+    out.append("")
     
     if local_check:
-        print(" STATUS: ✓ PROXY IS RUNNING")
-        print("")
-        print(" TELEGRAM SETUP:")
-        print(f"   1. Server: {server_ip}")
-        print(f"   2. Port: {proxy_port}")
-        print(f"   3. Username: admin")
-        print(f"   4. Password: {admin_password}")
-        print("")
-        print(" QUICK CONNECTION STRING:")
-        print(f"   socks5://admin:{admin_password}@{server_ip}:{proxy_port}")
-        print("")
-        print(" TELEGRAM DIRECT LINK (Click to add automatically):")
-        print(f"   https://t.me/socks?server={server_ip}&port={proxy_port}&user=admin&pass={admin_password}")
-        print("")
-        print(" NEXT STEPS:")
-        print("   1. Copy the connection details above")
-        print("   2. Configure your Telegram app")
-        print(f"   3. Test connection: python3 test-proxy.py --port {proxy_port}")
-        print("")
+        out.append(" STATUS: ✓ PROXY IS RUNNING")
+        out.append("")
+        out.append(" TELEGRAM SETUP:")
+        out.append(f"   1. Server: {server_ip}")
+        out.append(f"   2. Port: {proxy_port}")
+        out.append(f"   3. Username: admin")
+        out.append(f"   4. Password: {admin_password}")
+        out.append("")
+        out.append(" QUICK CONNECTION STRING:")
+        out.append(f"   socks5://admin:{admin_password}@{server_ip}:{proxy_port}")
+        out.append("")
+        out.append(" TELEGRAM DIRECT LINK (Click to add automatically):")
+        out.append(f"   https://t.me/socks?server={server_ip}&port={proxy_port}&user=admin&pass={admin_password}")
+        out.append("")
+        out.append(" NEXT STEPS:")
+        out.append("   1. Copy the connection details above")
+        out.append("   2. Configure your Telegram app")
+        out.append(f"   3. Test connection: python3 test-proxy.py --port {proxy_port}")
+        out.append("")
     else:
-        print(" STATUS: ✗ PROXY NOT ACCESSIBLE")
-        print("")
-        print(" TROUBLESHOOTING:")
-        print("   1. Check container: docker ps")
-        print("   2. Check logs: ./logs-proxy.sh")
-        print("   3. Restart: ./stop-proxy.sh && ./start-proxy.sh")
-        print("")
+        out.append(" STATUS: ✗ PROXY NOT ACCESSIBLE")
+        out.append("")
+        out.append(" TROUBLESHOOTING:")
+        out.append("   1. Check container: docker ps")
+        out.append("   2. Check logs: ./logs-proxy.sh")
+        out.append("   3. Restart: ./stop-proxy.sh && ./start-proxy.sh")
+        out.append("")
+    
+    # Emit the whole report in a single write
+    sys.stdout.write('\n'.join(out) + '\n')
+    sys.stdout.flush()
+    
+    if not local_check:
         sys.exit(1)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    asyncio.run(main()) 
\ No newline at end of file
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Asyncio SOCKS5 client shared by the proxy test scripts
+"""
+
+import asyncio
+import struct
+
+# Precompiled SOCKS5 message formats
+_B = struct.Struct('!B')
+_BB = struct.Struct('!BB')
+_PORT = struct.Struct('!H')
+_GREET_USERPASS = struct.pack('!BBB', 5, 1, 2)  # Version 5, 1 method, username/password
+_GREET_NOAUTH = struct.pack('!BBB', 5, 1, 0)  # Version 5, 1 method, no auth
+_CONNECT_DOMAIN = struct.pack('!BBBB', 5, 1, 0, 3)  # Version, connect, reserved, domain name type
+
+ERROR_MESSAGES = {
+    1: "General SOCKS server failure",
+    2: "Connection not allowed by ruleset",
+    3: "Network unreachable",
+    4: "Host unreachable",
+    5: "Connection refused",
+    6: "TTL expired",
+    7: "Command not supported",
+    8: "Address type not supported"
+}
+
+class Socks5ReplyError(Exception):
+    """The proxy refused a CONNECT request"""
+
+    def __init__(self, code):
+        self.code = code
+        error_msg = ERROR_MESSAGES.get(code, f"Unknown error code: {code}")
+        super().__init__(f"SOCKS5 connection failed: {error_msg}")
+
+class Socks5Client:
+    """SOCKS5 client for one proxy, reused for every connection a test makes"""
+
+    def __init__(self, proxy_host, proxy_port, username=None, password=None, log=None, timeout=10):
+        self.proxy_host = proxy_host
+        self.proxy_port = proxy_port
+        self.timeout = timeout
+        self._log = log or (lambda message: None)
+        self._auth_request = b''
+        if username and password:
+            self._auth_request = _BB.pack(1, len(username)) + username.encode()
+            self._auth_request += _B.pack(len(password)) + password.encode()
+
+    async def connect(self, target_host, target_port):
+        """Establish SOCKS5 connection and return the (reader, writer) streams"""
+        return await self._connect(target_host, target_port, bool(self._auth_request))
+
+    async def _connect(self, target_host, target_port, use_auth):
+        try:
+            self._log(f" Connecting to SOCKS5 proxy at {self.proxy_host}:{self.proxy_port}...")
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.proxy_host, self.proxy_port), timeout=self.timeout)
+
+            # Pipeline the greeting, credentials and CONNECT request in one send
+            handshake = _GREET_USERPASS + self._auth_request if use_auth else _GREET_NOAUTH
+            request = _CONNECT_DOMAIN + _B.pack(len(target_host)) + target_host.encode() + _PORT.pack(target_port)
+            writer.write(handshake + request)
+            await writer.drain()
+
+            version, method = _BB.unpack(await self._read_exact(reader, 2))
+
+            if version != 5:
+                raise Exception(f"Invalid SOCKS version: {version}")
+
+            if method == 0xFF:
+                raise Exception("No acceptable authentication method")
+
+            self._log(f" SOCKS5 handshake successful (method: {method})")
+
+            # Handle authentication if required
+            if method == 2:  # Username/password authentication
+                if not use_auth:
+                    raise Exception("Authentication required but no credentials provided")
+
+                self._log(" Performing authentication...")
+                auth_version, auth_status = _BB.unpack(await self._read_exact(reader, 2))
+
+                if auth_status != 0:
+                    raise Exception("Authentication failed")
+
+                self._log(" Authentication successful")
+            elif use_auth:
+                # The proxy skipped authentication and read the credentials as the request
+                self._log(" Proxy does not require authentication, retrying without credentials...")
+                writer.close()
+                return await self._connect(target_host, target_port, False)
+
+            self._log(f" Connecting to {target_host}:{target_port} through proxy...")
+            response_version, response_code = await self._read_connect_reply(reader)
+
+            if response_version != 5:
+                raise Exception(f"Invalid response version: {response_version}")
+
+            if response_code != 0:
+                raise Socks5ReplyError(response_code)
+
+            self._log(f" Successfully connected to {target_host}:{target_port}")
+            return reader, writer
+
+        except Exception as e:
+            if 'writer' in locals():
+                writer.close()
+            raise e
+
+    async def _read_exact(self, reader, size):
+        """Read exactly size bytes from the proxy stream"""
+        try:
+            return await asyncio.wait_for(reader.readexactly(size), timeout=self.timeout)
+        except asyncio.IncompleteReadError:
+            raise Exception("Connection closed by proxy")
+
+    async def _read_connect_reply(self, reader):
+        """Read a CONNECT reply, sized by its address type; returns (version, code)"""
+        version, code, _, address_type = await self._read_exact(reader, 4)
+        if address_type == 1:  # IPv4
+            remaining = 4 + 2
+        elif address_type == 3:  # Domain name
+            remaining = (await self._read_exact(reader, 1))[0] + 2
+        elif address_type == 4:  # IPv6
+            remaining = 16 + 2
+        else:
+            raise Exception(f"Invalid address type in reply: {address_type}")
+        await self._read_exact(reader, remaining)
+        return version, code
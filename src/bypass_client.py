@@ -5,26 +5,115 @@ Automatically tries different bypass methods when main proxy is blocked
 """
 
 import asyncio
+import ipaddress
 import socket
-import struct
-import ssl
-import base64
 import random
-import time
-import json
+import ssl
 import os
-from typing import Optional, Tuple, List
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, List
 import logging
-import aiohttp
-from cryptography.fernet import Fernet
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+from ip_cache import read_cached_ip, valid_ip, write_cached_ip
+
+# aiohttp is imported on first use so the direct path starts fast
+if TYPE_CHECKING:
+    import aiohttp
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# RFC 8305 delay before racing the next resolved address of a hostname
+HAPPY_EYEBALLS_DELAY = 0.25
+
+def _is_ip_literal(host: str) -> bool:
+    """Check whether host is an IP address rather than a name to resolve"""
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+def _resolve_once(host: str) -> str:
+    """Resolve host to an IPv4 address, keeping the name if lookup fails"""
+    if _is_ip_literal(host):
+        return host
+    try:
+        return socket.gethostbyname(host)
+    except OSError:
+        return host
+
+class _FrontSSLContext(ssl.SSLContext):
+    """Client TLS context that resumes the last session with each front"""
+    
+    def __new__(cls):
+        return super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+    
+    def __init__(self):
+        # The front's certificate never matches the proxy we tunnel to,
+        # so hostname and chain checks are off
+        self.check_hostname = False
+        self.verify_mode = ssl.CERT_NONE
+        self.sessions: Dict[str, ssl.SSLSession] = {}
+    
+    def wrap_bio(self, incoming, outgoing, server_side=False,
+                 server_hostname=None, session=None):
+        if session is None:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(incoming, outgoing, server_side,
+                                server_hostname, session)
+
+async def _first_connection(tasks: Dict[asyncio.Task, str],
+                            failure_level: int = logging.DEBUG) -> Optional[Tuple]:
+    """Return the first (reader, writer) produced by tasks and cancel the rest"""
+    pending = set(tasks)
+    winner = None
+    
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    continue
+                if task.exception() is not None:
+                    logger.log(failure_level, "%s failed: %s", tasks[task], task.exception())
+                elif winner is None:
+                    winner = task.result()
+                    logger.info("Successfully connected via %s", tasks[task])
+                else:
+                    task.result()[1].close()
+    finally:
+        # Cancel the losers and close any connection that slipped through
+        for task in pending:
+            task.cancel()
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if isinstance(result, tuple):
+                result[1].close()
+    
+    return winner
+
 class BypassClient:
     """Client that can connect through various bypass methods"""
     
+    # CDN fronts tried by domain fronting
+    FRONTING_DOMAINS = (
+        'cloudflare.com',
+        'amazonaws.com',
+        'googleapis.com',
+        'microsoft.com'
+    )
+    
+    # Headers sent with every HTTP tunnel request
+    TUNNEL_HEADERS = {
+        'Content-Type': 'application/octet-stream',
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+    
     def __init__(self, server_ip: str, main_port: int = 1081, 
                  username: str = 'admin', password: str = ''):
         self.server_ip = server_ip
@@ -32,11 +121,36 @@ class BypassClient:
         self.username = username
         self.password = password
         
+        # Resolve the server once so bypass methods connect by address
+        self._server_addr = _resolve_once(server_ip)
+        
+        # Static SOCKS5 frames, built once per client
+        self._greeting = b'\x05\x01\x02'  # Version 5, 1 method, username/password
+        self._user_b = username.encode()
+        self._pass_b = password.encode()
+        self._auth_request = (bytes((1, len(self._user_b))) + self._user_b
+                              + bytes((len(self._pass_b),)) + self._pass_b)
+        self._connect_prefix = b'\x05\x01\x00\x03'  # Version, connect, reserved, domain name type
+        
         # Bypass method ports
         self.http_tunnel_port = 8443
         self.websocket_port = 8444
         self.port_hop_range = (8000, 9000)
         
+        # TLS context for fronts, built on the first fronting attempt
+        self._front_ssl: Optional[_FrontSSLContext] = None
+        self._last_front = None
+        
+        # Port hop racing limits
+        self.max_parallel_ports = 8
+        self.port_attempt_timeout = 3.0
+        
+        # Delay between starting successive bypass methods
+        self.method_stagger_delay = 0.3
+        
+        # Shared HTTP session, created lazily on first use
+        self._session: Optional['aiohttp.ClientSession'] = None
+        
         # Connection methods in order of preference
         self.connection_methods = [
             self._connect_direct,
@@ -46,29 +160,58 @@ class BypassClient:
             self._connect_via_domain_fronting
         ]
     
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    async def _get_session(self) -> 'aiohttp.ClientSession':
+        """Return the shared HTTP session, creating it if needed"""
+        if self._session is None or self._session.closed:
+            import aiohttp
+            
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=32, limit_per_host=8, ttl_dns_cache=600,
+                    keepalive_timeout=75, enable_cleanup_closed=True
+                )
+            )
+        return self._session
+    
+    async def aclose(self):
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
     async def connect_with_fallback(self, target_host: str, target_port: int) -> Optional[Tuple]:
-        """Try to connect using various bypass methods"""
-        logger.info(f"Attempting to connect to {target_host}:{target_port}")
+        """Race the bypass methods and return the first connection that succeeds"""
+        logger.info("Attempting to connect to %s:%s", target_host, target_port)
         
-        for i, method in enumerate(self.connection_methods):
-            try:
-                logger.info(f"Trying method {i+1}/{len(self.connection_methods)}: {method.__name__}")
-                reader, writer = await method(target_host, target_port)
-                logger.info(f"Successfully connected via {method.__name__}")
-                return reader, writer
-            except Exception as e:
-                logger.warning(f"Method {method.__name__} failed: {e}")
-                continue
+        async def attempt(i, method):
+            # Stagger starts so a fast preferred method wins without
+            # opening sockets for every fallback
+            if i:
+                await asyncio.sleep(i * self.method_stagger_delay)
+            logger.info("Trying method %d/%d: %s", i + 1, len(self.connection_methods), method.__name__)
+            return await method(target_host, target_port)
+        
+        tasks = {
+            asyncio.create_task(attempt(i, method)): method.__name__
+            for i, method in enumerate(self.connection_methods)
+        }
+        connection = await _first_connection(tasks, logging.WARNING)
         
-        logger.error("All bypass methods failed")
-        return None
+        if connection is None:
+            logger.error("All bypass methods failed")
+        return connection
     
     async def _connect_direct(self, target_host: str, target_port: int) -> Tuple:
         """Try direct connection to main SOCKS5 proxy"""
         return await self._socks5_connect(
-            self.server_ip, self.main_port, 
-            target_host, target_port,
-            self.username, self.password
+            self._server_addr, self.main_port, 
+            target_host, target_port
         )
     
     async def _connect_via_http_tunnel(self, target_host: str, target_port: int) -> Tuple:
@@ -77,27 +220,26 @@ class BypassClient:
         socks_data = await self._build_socks5_request(target_host, target_port)
         
         # Send via HTTP tunnel (connect to bypass server)
-        tunnel_host = "localhost" if self.server_ip in ['127.0.0.1', 'localhost'] else self.server_ip
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"http://{tunnel_host}:{self.http_tunnel_port}/tunnel",
-                data=socks_data,
-                headers={
-                    'Content-Type': 'application/octet-stream',
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                }
-            ) as response:
-                if response.status == 200:
-                    response_data = await response.read()
-                    # Create mock reader/writer for HTTP tunnel
-                    return await self._create_http_tunnel_connection(response_data)
-                else:
-                    raise Exception(f"HTTP tunnel failed: {response.status}")
+        tunnel_host = self._server_addr
+        session = await self._get_session()
+        async with session.post(
+            f"http://{tunnel_host}:{self.http_tunnel_port}/tunnel",
+            data=socks_data,
+            headers=self.TUNNEL_HEADERS
+        ) as response:
+            if response.status == 200:
+                response_data = await response.read()
+                # Create mock reader/writer for HTTP tunnel
+                return await self._create_http_tunnel_connection(response_data)
+            else:
+                raise Exception(f"HTTP tunnel failed: {response.status}")
     
     async def _connect_via_websocket(self, target_host: str, target_port: int) -> Tuple:
         """Connect via WebSocket tunnel"""
-        ws_host = "localhost" if self.server_ip in ['127.0.0.1', 'localhost'] else self.server_ip
-        session = aiohttp.ClientSession()
+        import aiohttp
+        
+        ws_host = self._server_addr
+        session = await self._get_session()
         ws = await session.ws_connect(f"ws://{ws_host}:{self.websocket_port}/ws")
         
         # Send SOCKS5 request via WebSocket
@@ -110,181 +252,195 @@ class BypassClient:
             # Create mock reader/writer for WebSocket
             return await self._create_websocket_connection(ws, session)
         else:
-            await session.close()
+            await ws.close()
             raise Exception("WebSocket tunnel failed")
     
     async def _connect_via_port_hop(self, target_host: str, target_port: int) -> Tuple:
         """Connect via port hopping"""
+        # Use the correct server IP for port info endpoint
+        hop_host = self._server_addr
+        candidates = []
+        
         # Get current active port from bypass server
         try:
-            # Use the correct server IP for port info endpoint
-            port_info_host = "localhost" if self.server_ip in ['127.0.0.1', 'localhost'] else self.server_ip
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"http://{port_info_host}:{self.http_tunnel_port}/port-info") as response:
-                    if response.status == 200:
-                        port_info = await response.json()
-                        current_port = port_info.get('current_port')
-                        active_ports = port_info.get('active_ports', [])
-                        
-                        # Try current port first
-                        if current_port:
-                            try:
-                                return await self._socks5_connect(
-                                    port_info_host, current_port,
-                                    target_host, target_port,
-                                    self.username, self.password
-                                )
-                            except Exception as e:
-                                logger.debug(f"Current port {current_port} failed: {e}")
-                        
-                        # Try other active ports
-                        for port in active_ports:
-                            if port != current_port:
-                                try:
-                                    return await self._socks5_connect(
-                                        port_info_host, port,
-                                        target_host, target_port,
-                                        self.username, self.password
-                                    )
-                                except Exception as e:
-                                    logger.debug(f"Port {port} failed: {e}")
-                                    continue
+            session = await self._get_session()
+            async with session.get(f"http://{hop_host}:{self.http_tunnel_port}/port-info") as response:
+                if response.status == 200:
+                    port_info = await response.json(loads=json_loads)
+                    current_port = port_info.get('current_port')
+                    active_ports = port_info.get('active_ports', [])
+                    
+                    # Current port first, then the rest still in grace period
+                    if current_port:
+                        candidates.append(current_port)
+                    candidates.extend(port for port in active_ports if port != current_port)
         except Exception as e:
-            logger.debug(f"Failed to get port info: {e}")
+            logger.debug("Failed to get port info: %s", e)
+        
+        if candidates:
+            connection = await self._race_ports(hop_host, candidates, target_host, target_port)
+            if connection:
+                return connection
         
         # Fallback to random port attempts
-        fallback_host = "localhost" if self.server_ip in ['127.0.0.1', 'localhost'] else self.server_ip
-        for _ in range(5):  # Try up to 5 random ports
-            hop_port = random.randint(*self.port_hop_range)
-            try:
-                return await self._socks5_connect(
-                    fallback_host, hop_port,
-                    target_host, target_port,
-                    self.username, self.password
-                )
-            except:
-                continue
+        low, high = self.port_hop_range
+        random_ports = random.sample(range(low, high + 1), 5)
+        connection = await self._race_ports(hop_host, random_ports, target_host, target_port)
+        if connection:
+            return connection
         
         raise Exception("No active port hop found")
     
+    async def _race_ports(self, host: str, ports: List[int],
+                          target_host: str, target_port: int) -> Optional[Tuple]:
+        """Try several hop ports at once and keep the first that connects"""
+        tasks = {
+            asyncio.create_task(asyncio.wait_for(
+                self._socks5_connect(host, port, target_host, target_port),
+                timeout=self.port_attempt_timeout
+            )): f"port {port}"
+            for port in ports[:self.max_parallel_ports]
+        }
+        return await _first_connection(tasks)
+    
     async def _connect_via_domain_fronting(self, target_host: str, target_port: int) -> Tuple:
-        """Connect via domain fronting"""
-        fronting_domains = [
-            'cloudflare.com',
-            'amazonaws.com',
-            'googleapis.com',
-            'microsoft.com'
-        ]
+        """Connect via domain fronting, racing every CDN front"""
+        # Start the last working front first
+        domains = sorted(self.FRONTING_DOMAINS, key=lambda d: d != self._last_front)
+        tasks = {
+            asyncio.create_task(self._try_front(domain, target_host, target_port)): domain
+            for domain in domains
+        }
+        connection = await _first_connection(tasks)
         
-        for domain in fronting_domains:
-            try:
-                # Create SSL connection to fronting domain
-                context = ssl.create_default_context()
-                context.check_hostname = False
-                context.verify_mode = ssl.CERT_NONE
-                
-                reader, writer = await asyncio.open_connection(
-                    domain, 443, ssl=context
-                )
-                
-                # Send CONNECT request
-                connect_request = f"CONNECT {self.server_ip}:{self.main_port} HTTP/1.1\r\n"
-                connect_request += f"Host: {self.server_ip}:{self.main_port}\r\n"
-                connect_request += "Proxy-Connection: keep-alive\r\n\r\n"
-                
-                writer.write(connect_request.encode())
-                await writer.drain()
-                
-                # Read CONNECT response
-                response = await reader.readline()
-                if b'200' in response:
-                    # Now we can use this connection as SOCKS5
-                    return await self._socks5_handshake_over_connection(
-                        reader, writer, target_host, target_port
-                    )
-                else:
-                    writer.close()
-                    continue
-            except Exception as e:
-                logger.debug(f"Domain fronting via {domain} failed: {e}")
-                continue
+        if connection is None:
+            raise Exception("Domain fronting failed")
+        return connection
+    
+    def _get_front_ssl(self) -> _FrontSSLContext:
+        """Return the TLS context for fronts, creating it if needed"""
+        if self._front_ssl is None:
+            self._front_ssl = _FrontSSLContext()
+        return self._front_ssl
+    
+    async def _try_front(self, domain: str, target_host: str, target_port: int) -> Tuple:
+        """Tunnel to the main proxy through a single fronting domain"""
+        # Create SSL connection to fronting domain
+        reader, writer = await asyncio.open_connection(
+            domain, 443, ssl=self._get_front_ssl(),
+            happy_eyeballs_delay=HAPPY_EYEBALLS_DELAY, interleave=1
+        )
+        
+        try:
+            # Send CONNECT request
+            connect_request = f"CONNECT {self.server_ip}:{self.main_port} HTTP/1.1\r\n"
+            connect_request += f"Host: {self.server_ip}:{self.main_port}\r\n"
+            connect_request += "Proxy-Connection: keep-alive\r\n\r\n"
+            
+            writer.write(connect_request.encode())
+            await writer.drain()
+            
+            # Read the whole CONNECT response header block so none of it
+            # is mistaken for SOCKS5 bytes
+            response = await reader.readuntil(b'\r\n\r\n')
+            status_line = response.split(b'\r\n', 1)[0]
+            if b' 200' not in status_line:
+                raise Exception(f"CONNECT rejected: {status_line!r}")
+            
+            # Now we can use this connection as SOCKS5
+            connection = await self._socks5_handshake_over_connection(
+                reader, writer, target_host, target_port
+            )
+        except BaseException:
+            writer.close()
+            raise
         
-        raise Exception("Domain fronting failed")
+        # Keep the TLS session so the next attempt on this front resumes it
+        ssl_object = writer.get_extra_info('ssl_object')
+        if ssl_object is not None and ssl_object.session is not None:
+            self._front_ssl.sessions[domain] = ssl_object.session
+        
+        self._last_front = domain
+        return connection
     
     async def _socks5_connect(self, proxy_host: str, proxy_port: int,
-                             target_host: str, target_port: int,
-                             username: str, password: str) -> Tuple:
+                             target_host: str, target_port: int) -> Tuple:
         """Standard SOCKS5 connection"""
-        reader, writer = await asyncio.open_connection(proxy_host, proxy_port)
+        if _is_ip_literal(proxy_host):
+            reader, writer = await asyncio.open_connection(proxy_host, proxy_port)
+        else:
+            reader, writer = await asyncio.open_connection(
+                proxy_host, proxy_port,
+                happy_eyeballs_delay=HAPPY_EYEBALLS_DELAY, interleave=1
+            )
         
         try:
-            # SOCKS5 handshake
-            handshake = struct.pack('!BBB', 5, 1, 2)  # Version 5, 1 method, username/password
-            writer.write(handshake)
+            # Greeting, auth and CONNECT go out in a single write; the
+            # proxy answers each of them in turn
+            writer.writelines(self._socks5_request_parts(target_host, target_port))
             await writer.drain()
             
-            response = await reader.read(2)
-            if len(response) != 2:
-                raise Exception("Invalid handshake response")
-            
-            version, method = struct.unpack('!BB', response)
+            response = await reader.readexactly(2)
+            version, method = response[0], response[1]
             if version != 5 or method != 2:
                 raise Exception("SOCKS5 handshake failed")
             
-            # Authentication
-            auth_request = struct.pack('!BB', 1, len(username)) + username.encode()
-            auth_request += struct.pack('!B', len(password)) + password.encode()
-            
-            writer.write(auth_request)
-            await writer.drain()
-            
-            auth_response = await reader.read(2)
-            if len(auth_response) != 2:
-                raise Exception("Invalid auth response")
-            
-            auth_version, auth_status = struct.unpack('!BB', auth_response)
+            auth_response = await reader.readexactly(2)
+            auth_version, auth_status = auth_response[0], auth_response[1]
             if auth_status != 0:
                 raise Exception("Authentication failed")
             
-            # Connect request
-            request = struct.pack('!BBB', 5, 1, 0)  # Version, connect, reserved
-            request += struct.pack('!B', 3)  # Domain name type
-            request += struct.pack('!B', len(target_host)) + target_host.encode()
-            request += struct.pack('!H', target_port)
-            
-            writer.write(request)
-            await writer.drain()
-            
-            connect_response = await reader.read(10)
-            if len(connect_response) < 10:
-                raise Exception("Invalid connect response")
-            
-            response_version, response_code = struct.unpack('!BB', connect_response[:2])
+            connect_response = await self._read_connect_reply(reader)
+            response_version, response_code = connect_response[0], connect_response[1]
             if response_version != 5 or response_code != 0:
                 raise Exception(f"SOCKS5 connect failed: {response_code}")
             
             return reader, writer
         
+        except asyncio.IncompleteReadError:
+            writer.close()
+            raise Exception("Invalid response")
+        except asyncio.CancelledError:
+            # Lost a race or timed out; free the socket straight away
+            writer.close()
+            raise
         except Exception as e:
             writer.close()
             raise e
     
+    def _socks5_request_parts(self, target_host: str, target_port: int) -> List[bytes]:
+        """Greeting, auth and CONNECT segments for a domain name target"""
+        # IDNA turns unicode names into punycode and rejects malformed ones
+        # before anything is sent
+        try:
+            host = target_host.encode('idna')
+        except UnicodeError as e:
+            raise Exception(f"Invalid target host {target_host!r}: {e}")
+        if len(host) > 255:
+            raise Exception(f"Target host too long: {target_host!r}")
+        return [
+            self._greeting, self._auth_request, self._connect_prefix,
+            bytes((len(host),)), host, target_port.to_bytes(2, 'big')
+        ]
+    
     async def _build_socks5_request(self, target_host: str, target_port: int) -> bytes:
         """Build SOCKS5 request data for tunneling"""
-        # Handshake
-        handshake = struct.pack('!BBB', 5, 1, 2)
-        
-        # Authentication
-        auth_request = struct.pack('!BB', 1, len(self.username)) + self.username.encode()
-        auth_request += struct.pack('!B', len(self.password)) + self.password.encode()
-        
-        # Connect request
-        connect_request = struct.pack('!BBB', 5, 1, 0)
-        connect_request += struct.pack('!B', 3)
-        connect_request += struct.pack('!B', len(target_host)) + target_host.encode()
-        connect_request += struct.pack('!H', target_port)
-        
-        return handshake + auth_request + connect_request
+        return b''.join(self._socks5_request_parts(target_host, target_port))
+    
+    async def _read_connect_reply(self, reader) -> bytes:
+        """Read a full CONNECT reply, sized by its address type"""
+        header = await reader.readexactly(4)
+        addr_type = header[3]
+        if addr_type == 1:  # IPv4 + port
+            remaining = 6
+        elif addr_type == 4:  # IPv6 + port
+            remaining = 18
+        elif addr_type == 3:  # Domain name + port
+            remaining = (await reader.readexactly(1))[0] + 2
+        else:
+            raise Exception(f"Invalid address type in connect reply: {addr_type}")
+        await reader.readexactly(remaining)
+        return header
     
     async def _create_http_tunnel_connection(self, response_data: bytes):
         """Create mock connection for HTTP tunnel"""
@@ -304,38 +460,24 @@ class BypassClient:
     
     async def _socks5_connect_with_connection(self, reader, writer, target_host: str, target_port: int):
         """SOCKS5 connect using existing connection"""
-        # Handshake
-        handshake = struct.pack('!BBB', 5, 1, 2)
-        writer.write(handshake)
-        await writer.drain()
-        
-        response = await reader.read(2)
-        version, method = struct.unpack('!BB', response)
-        
-        # Authentication
-        auth_request = struct.pack('!BB', 1, len(self.username)) + self.username.encode()
-        auth_request += struct.pack('!B', len(self.password)) + self.password.encode()
-        
-        writer.write(auth_request)
-        await writer.drain()
-        
-        auth_response = await reader.read(2)
-        auth_version, auth_status = struct.unpack('!BB', auth_response)
-        
-        if auth_status != 0:
-            raise Exception("Authentication failed")
-        
-        # Connect request
-        request = struct.pack('!BBB', 5, 1, 0)
-        request += struct.pack('!B', 3)
-        request += struct.pack('!B', len(target_host)) + target_host.encode()
-        request += struct.pack('!H', target_port)
-        
-        writer.write(request)
+        writer.writelines(self._socks5_request_parts(target_host, target_port))
         await writer.drain()
         
-        connect_response = await reader.read(10)
-        response_version, response_code = struct.unpack('!BB', connect_response[:2])
+        try:
+            response = await reader.readexactly(2)
+            version, method = response[0], response[1]
+            
+            auth_response = await reader.readexactly(2)
+            auth_version, auth_status = auth_response[0], auth_response[1]
+            
+            if auth_status != 0:
+                raise Exception("Authentication failed")
+            
+            connect_response = await self._read_connect_reply(reader)
+            response_version, response_code = connect_response[0], connect_response[1]
+        except asyncio.IncompleteReadError:
+            writer.close()
+            raise Exception("Invalid response")
         
         if response_code != 0:
             raise Exception(f"Connect failed: {response_code}")
@@ -347,13 +489,18 @@ def load_client_config():
     config = {}
     
     # Try to load from config file
-    if os.path.exists('config/proxy.env'):
+    try:
         with open('config/proxy.env', 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    config[key.strip()] = value.strip()
+            lines = [line.strip() for line in f.read().splitlines()]
+        config = {
+            key.strip(): value.strip()
+            for key, value in (
+                line.split('=', 1) for line in lines
+                if line and not line.startswith('#') and '=' in line
+            )
+        }
+    except FileNotFoundError:
+        pass
     
     # Detect server IP - try multiple methods
     server_ip = '127.0.0.1'  # fallback
@@ -368,28 +515,37 @@ def load_client_config():
             import subprocess
             import socket
             
-            # Try to get external IP
-            try:
-                result = subprocess.run(['curl', '-s', '--connect-timeout', '5', 'http://ifconfig.me'], 
-                                      capture_output=True, text=True, timeout=10)
-                if result.returncode == 0 and result.stdout.strip():
-                    detected_ip = result.stdout.strip()
-                    # Verify it's not localhost
-                    if detected_ip not in ['127.0.0.1', 'localhost']:
-                        server_ip = detected_ip
-            except:
-                pass
-            
             # Method 3: Check if we can connect to localhost:1081 (local testing)
+            # It overrides any external IP, so run it before the lookup
+            local_proxy = False
             try:
                 sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 sock.settimeout(2)
                 result = sock.connect_ex(('127.0.0.1', 1081))
                 sock.close()
-                if result == 0:  # Connection successful
-                    server_ip = '127.0.0.1'  # Use localhost for local testing
+                local_proxy = result == 0  # Connection successful
             except:
                 pass
+            
+            if local_proxy:
+                server_ip = '127.0.0.1'  # Use localhost for local testing
+            else:
+                # Try to get external IP, reusing a recently detected one
+                cached_ip = read_cached_ip()
+                if cached_ip:
+                    server_ip = cached_ip
+                else:
+                    try:
+                        result = subprocess.run(['curl', '-s', '--connect-timeout', '5', 'http://ifconfig.me'], 
+                                              capture_output=True, text=True, timeout=10)
+                        if result.returncode == 0:
+                            # Verify it's an IP address and not localhost
+                            detected_ip = valid_ip(result.stdout)
+                            if detected_ip and not ipaddress.ip_address(detected_ip).is_loopback:
+                                server_ip = detected_ip
+                                write_cached_ip(detected_ip)
+                    except:
+                        pass
                 
         except Exception as e:
             logger.debug(f"Server IP detection failed: {e}")
@@ -410,31 +566,30 @@ async def test_bypass_connection():
     """Test bypass connection methods"""
     config = load_client_config()
     
-    client = BypassClient(
-        server_ip=config['server_ip'],
-        main_port=config['main_port'],
-        username=config['username'],
-        password=config['password']
-    )
-    
     print(f"Testing bypass connection to {config['server_ip']}:{config['main_port']}")
     print(f"Username: {config['username']}")
     print(f"Password: {'*' * len(config['password'])}")
     print()
     
-    # Test connection to Telegram
-    try:
-        connection = await client.connect_with_fallback('api.telegram.org', 443)
-        if connection:
-            reader, writer = connection
-            print(" Successfully connected via bypass methods!")
-            print(" Your bypass proxy is working!")
-            writer.close()
-            await writer.wait_closed()
-        else:
-            print(" All bypass methods failed")
-    except Exception as e:
-        print(f" Bypass connection failed: {e}")
+    async with BypassClient(
+        server_ip=config['server_ip'],
+        main_port=config['main_port'],
+        username=config['username'],
+        password=config['password']
+    ) as client:
+        # Test connection to Telegram
+        try:
+            connection = await client.connect_with_fallback('api.telegram.org', 443)
+            if connection:
+                reader, writer = connection
+                print(" Successfully connected via bypass methods!")
+                print(" Your bypass proxy is working!")
+                writer.close()
+                await writer.wait_closed()
+            else:
+                print(" All bypass methods failed")
+        except Exception as e:
+            print(f" Bypass connection failed: {e}")
 
 if __name__ == '__main__':
     asyncio.run(test_bypass_connection()) 
\ No newline at end of file
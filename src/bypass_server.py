@@ -5,8 +5,6 @@ Implements multiple bypass techniques to avoid blocking
 """
 
 import asyncio
-import socket
-import struct
 import ssl
 import base64
 import random
@@ -14,17 +12,87 @@ import time
 import hashlib
 import json
 import os
-from typing import Dict, List, Optional, Tuple
+from typing import List, Optional, Tuple
 import logging
 from dataclasses import dataclass
 from aiohttp import web, ClientSession
 import aiohttp
-from cryptography.fernet import Fernet
+import uvloop
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from relay import SPLICE_AVAILABLE, dup_socket, splice_data
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Decoy responses, built once at import
+_FAKE_HTML = """
+<!DOCTYPE html>
+<html>
+<head><title>CDN Service</title></head>
+<body>
+<h1>Content Delivery Network</h1>
+<p>This is a CDN service for static content delivery.</p>
+<p>Status: Online</p>
+</body>
+</html>
+""".encode()
+
+_FAKE_CHAT_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Chat Application</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        #messages { border: 1px solid #ccc; height: 300px; overflow-y: scroll; padding: 10px; }
+        #messageInput { width: 80%; padding: 5px; }
+        #sendButton { padding: 5px 10px; }
+    </style>
+</head>
+<body>
+    <h1>Secure Chat</h1>
+    <div id="messages"></div>
+    <input type="text" id="messageInput" placeholder="Type a message...">
+    <button id="sendButton">Send</button>
+
+    <script>
+        // Fake chat application (non-functional, just for appearance)
+        const messages = document.getElementById('messages');
+        const input = document.getElementById('messageInput');
+        const button = document.getElementById('sendButton');
+
+        button.onclick = () => {
+            if (input.value.trim()) {
+                const div = document.createElement('div');
+                div.textContent = `You: ${input.value}`;
+                messages.appendChild(div);
+                input.value = '';
+                messages.scrollTop = messages.scrollHeight;
+            }
+        };
+
+        input.onkeypress = (e) => {
+            if (e.key === 'Enter') button.click();
+        };
+    </script>
+</body>
+</html>
+""".encode()
+
+_HEALTH_JSON = json.dumps({'status': 'ok', 'service': 'cdn'}).encode()
+
+_FAKE_API_JSON = json.dumps({
+    'version': '1.2.3',
+    'status': 'operational',
+    'uptime': time.time(),  # server start time
+    'endpoints': ['/api/status', '/health', '/static/*']
+}).encode()
+
+_FAKE_STATIC_TAIL = b" */\nbody { font-family: Arial; }"
+
 @dataclass
 class BypassConfig:
     """Configuration for bypass methods"""
@@ -47,103 +115,192 @@ class BypassConfig:
     # Domain fronting
     fronting_domains: List[str] = None
 
+def generate_obfuscation_key() -> bytes:
+    """Generate a urlsafe base64 encoded AES-256 key"""
+    return base64.urlsafe_b64encode(AESGCM.generate_key(bit_length=256))
+
 class TrafficObfuscator:
     """Obfuscates traffic to avoid DPI detection"""
     
+    # Pre-encoded pieces of the fake HTTP request prepended to each packet
+    _USER_AGENTS = (
+        b'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        b'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+        b'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
+    )
+    _FAKE_PATHS = (b'/api/v1/data', b'/static/js/app.js', b'/images/logo.png', b'/css/style.css')
+    _HEADER_TAIL = (
+        b"\r\n"
+        b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+        b"Accept-Language: en-US,en;q=0.5\r\n"
+        b"Accept-Encoding: gzip, deflate\r\n"
+        b"Connection: keep-alive"
+    )
+    
+    # Payloads above this size are decrypted in the default executor
+    OFFLOAD_THRESHOLD = 65536
+    
     def __init__(self, key: bytes = None):
-        self.key = key or Fernet.generate_key()
-        self.cipher = Fernet(self.key)
+        self.key = key or generate_obfuscation_key()
+        self.cipher = AESGCM(base64.urlsafe_b64decode(self.key))
+        
+        # Per-packet choices come from a private PRNG; nonce and padding
+        # bytes are sliced from a urandom pool that is refilled in bulk
+        self._rng = random.Random()
+        self._pool = b''
+        self._pool_offset = 0
+    
+    def _random_bytes(self, n: int) -> bytes:
+        """Take n unused bytes from the urandom pool"""
+        if self._pool_offset + n > len(self._pool):
+            self._pool = os.urandom(4096)
+            self._pool_offset = 0
+        chunk = self._pool[self._pool_offset:self._pool_offset + n]
+        self._pool_offset += n
+        return chunk
     
     def obfuscate(self, data: bytes) -> bytes:
         """Obfuscate outgoing data"""
         # Add random padding
-        padding_size = random.randint(1, 16)
-        padding = os.urandom(padding_size)
+        padding_size = self._rng.getrandbits(4) + 1
+        padding = self._random_bytes(padding_size)
         
-        # Encrypt the data
-        encrypted = self.cipher.encrypt(data)
+        # Encrypt the data; the random nonce travels in front of the ciphertext
+        nonce = self._random_bytes(12)
+        encrypted = self.cipher.encrypt(nonce, data, None)
         
         # Add fake HTTP headers to look like web traffic
         fake_headers = self._generate_fake_http_headers()
         
-        # Combine everything
-        obfuscated = fake_headers.encode() + b'\r\n\r\n' + encrypted + padding
-        return obfuscated
+        # Combine everything in one copy; the byte after the headers gives
+        # the padding length
+        return b''.join((fake_headers, b'\r\n\r\n', bytes((padding_size,)),
+                         nonce, encrypted, padding))
+    
+    async def deobfuscate_async(self, data: bytes) -> bytes:
+        """Deobfuscate, moving large payloads off the event loop"""
+        if len(data) <= self.OFFLOAD_THRESHOLD:
+            return self.deobfuscate(data)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.deobfuscate, data)
     
     def deobfuscate(self, data: bytes) -> bytes:
         """Deobfuscate incoming data"""
         try:
-            # Split headers and body
-            if b'\r\n\r\n' in data:
-                _, body = data.split(b'\r\n\r\n', 1)
-            else:
-                body = data
+            # Skip the headers; slices of the view below don't copy the body
+            header_end = data.find(b'\r\n\r\n')
+            body = memoryview(data)[header_end + 4:] if header_end >= 0 else memoryview(data)
             
-            # Remove padding (try different lengths)
-            for padding_size in range(1, 17):
-                try:
-                    encrypted_data = body[:-padding_size] if padding_size > 0 else body
-                    decrypted = self.cipher.decrypt(encrypted_data)
-                    return decrypted
-                except:
-                    continue
+            # Strip the padding using its length prefix
+            padding_size = body[0]
+            if not 1 <= padding_size <= 16:
+                return data
+            encrypted = body[1:len(body) - padding_size]
             
-            # If deobfuscation fails, return original data
-            return data
+            # A single authenticated decrypt; a bad tag means it was not ours
+            try:
+                return self.cipher.decrypt(encrypted[:12], encrypted[12:], None)
+            except InvalidTag:
+                return data
         except Exception as e:
             logger.warning(f"Deobfuscation failed: {e}")
             return data
     
-    def _generate_fake_http_headers(self) -> str:
+    def _generate_fake_http_headers(self) -> bytes:
         """Generate fake HTTP headers to mimic web traffic"""
-        user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
-        ]
-        
-        fake_paths = ['/api/v1/data', '/static/js/app.js', '/images/logo.png', '/css/style.css']
-        
-        headers = f"GET {random.choice(fake_paths)} HTTP/1.1\r\n"
-        headers += f"Host: cdn.cloudflare.com\r\n"
-        headers += f"User-Agent: {random.choice(user_agents)}\r\n"
-        headers += f"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
-        headers += f"Accept-Language: en-US,en;q=0.5\r\n"
-        headers += f"Accept-Encoding: gzip, deflate\r\n"
-        headers += f"Connection: keep-alive\r\n"
+        return (b"GET " + self._FAKE_PATHS[self._rng.getrandbits(2)] + b" HTTP/1.1\r\n"
+                b"Host: cdn.cloudflare.com\r\n"
+                b"User-Agent: " + self._rng.choice(self._USER_AGENTS) + self._HEADER_TAIL)
+
+class SocksBackendPool:
+    """Keeps fresh connections to the SOCKS5 proxy ready for tunnels"""
+    
+    def __init__(self, config: BypassConfig, size: int = None):
+        self.config = config
+        self.size = size or (os.cpu_count() or 1) * 2
+        self.max_idle_age = 60.0  # seconds
+        self._idle: asyncio.Queue = asyncio.Queue(maxsize=self.size)
+        self._refill_task: Optional[asyncio.Task] = None
+    
+    async def acquire(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Take a ready connection, or open one if none is idle"""
+        while not self._idle.empty():
+            reader, writer, created = self._idle.get_nowait()
+            if (time.monotonic() - created < self.max_idle_age
+                    and not reader.at_eof() and not writer.is_closing()):
+                self._schedule_refill()
+                return reader, writer
+            writer.close()
         
-        return headers
+        self._schedule_refill()
+        return await asyncio.open_connection(self.config.socks_host, self.config.socks_port)
+    
+    def _schedule_refill(self):
+        """Top the idle queue back up in the background"""
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+    
+    async def _refill(self):
+        try:
+            while not self._idle.full():
+                reader, writer = await asyncio.open_connection(
+                    self.config.socks_host, self.config.socks_port
+                )
+                self._idle.put_nowait((reader, writer, time.monotonic()))
+        except Exception as e:
+            logger.debug(f"Backend pool refill failed: {e}")
 
 class PortHopper:
     """Implements port hopping to avoid port-based blocking"""
     
-    def __init__(self, config: BypassConfig):
+    def __init__(self, config: BypassConfig, backend_pool: SocksBackendPool = None):
         self.config = config
+        self.backend_pool = backend_pool or SocksBackendPool(config)
         self.current_port = None
-        self.servers: Dict[int, asyncio.Server] = {}
-        self.last_hop = 0
+        
+        # Hop targets, drawn from a private PRNG
+        self._rng = random.Random()
+        self._port_candidates = list(range(config.port_range[0], config.port_range[1] + 1))
+        
+        # At most two listeners: the current port and the one in its grace period
+        self._current: Optional[Tuple[int, asyncio.Server]] = None
+        self._old: Optional[Tuple[int, asyncio.Server]] = None
+        
+        # Serialized /port-info body, rebuilt whenever the listeners change
+        self.port_info_json: Optional[bytes] = None
+    
+    @property
+    def active_ports(self) -> List[int]:
+        """Ports currently accepting hopped connections"""
+        return [port for port, _ in filter(None, (self._current, self._old))]
+    
+    def _refresh_port_info(self):
+        """Re-serialize the port info served to clients"""
+        self.port_info_json = json.dumps({
+            'current_port': self.current_port,
+            'active_ports': self.active_ports,
+            'port_range': self.config.port_range,
+            'hop_interval': self.config.hop_interval
+        }).encode()
     
     async def start_hopping(self):
         """Start port hopping service"""
         logger.info("Starting port hopping service...")
         
+        # The first hop is made by BypassServer on startup
         while True:
-            current_time = time.time()
-            
-            # Check if it's time to hop
-            if current_time - self.last_hop >= self.config.hop_interval:
-                await self.hop_to_new_port()
-                self.last_hop = current_time
-            
-            await asyncio.sleep(30)  # Check every 30 seconds
+            await asyncio.sleep(self.config.hop_interval)
+            await self.hop_to_new_port()
     
     async def hop_to_new_port(self):
         """Hop to a new random port"""
-        new_port = random.randint(*self.config.port_range)
+        candidates = self._port_candidates
+        new_port = self._rng.choice(candidates)
         
-        # Make sure it's different from current port
-        while new_port == self.current_port:
-            new_port = random.randint(*self.config.port_range)
+        # Make sure it's different from current port; step to the neighbour
+        # rather than redrawing
+        if new_port == self.current_port and len(candidates) > 1:
+            new_port = candidates[(candidates.index(new_port) + 1) % len(candidates)]
         
         try:
             # Start server on new port
@@ -153,18 +310,22 @@ class PortHopper:
                 new_port
             )
             
-            self.servers[new_port] = server
+            old = self._old = self._current
+            self._current = (new_port, server)
             old_port = self.current_port
             self.current_port = new_port
+            self._refresh_port_info()
             
             logger.info(f"Hopped from port {old_port} to {new_port}")
             
             # Close old server after delay
-            if old_port and old_port in self.servers:
+            if old:
                 await asyncio.sleep(60)  # Grace period
-                self.servers[old_port].close()
-                await self.servers[old_port].wait_closed()
-                del self.servers[old_port]
+                old[1].close()
+                await old[1].wait_closed()
+                if self._old is old:
+                    self._old = None
+                    self._refresh_port_info()
                 logger.info(f"Closed old port {old_port}")
         
         except Exception as e:
@@ -178,17 +339,17 @@ class PortHopper:
         # Forward to main SOCKS5 proxy
         try:
             # Connect to main proxy
-            proxy_reader, proxy_writer = await asyncio.open_connection(
-                self.config.socks_host, 
-                self.config.socks_port
-            )
+            proxy_reader, proxy_writer = await self.backend_pool.acquire()
             
-            # Start bidirectional forwarding
-            await asyncio.gather(
-                self._forward_data(reader, proxy_writer, "client->proxy"),
-                self._forward_data(proxy_reader, writer, "proxy->client"),
-                return_exceptions=True
-            )
+            # Start bidirectional forwarding, in the kernel where possible
+            if SPLICE_AVAILABLE:
+                await self._splice_connection(reader, writer, proxy_writer)
+            else:
+                await asyncio.gather(
+                    self._forward_data(reader, proxy_writer, "client->proxy"),
+                    self._forward_data(proxy_reader, writer, "proxy->client"),
+                    return_exceptions=True
+                )
         
         except Exception as e:
             logger.error(f"Port hop forwarding error: {e}")
@@ -196,15 +357,43 @@ class PortHopper:
             writer.close()
             await writer.wait_closed()
     
+    async def _splice_connection(self, reader, writer, proxy_writer):
+        """Relay a hopped connection with splice(2) instead of copying through Python"""
+        # Stop the proxy transport reading so nothing lands in its buffer
+        proxy_writer.transport.pause_reading()
+        
+        try:
+            # The client's first bytes may already sit in the stream buffer;
+            # flow control caps it well below this read size, so this drains it
+            first = await reader.read(1 << 20)
+            writer.transport.pause_reading()
+            if not first:
+                return
+            proxy_writer.write(first)
+            await proxy_writer.drain()
+            
+            client_sock = dup_socket(writer)
+            proxy_sock = dup_socket(proxy_writer)
+            with client_sock, proxy_sock:
+                await asyncio.gather(
+                    splice_data(client_sock, proxy_sock, "client->proxy"),
+                    splice_data(proxy_sock, client_sock, "proxy->client"),
+                    return_exceptions=True
+                )
+        finally:
+            proxy_writer.close()
+    
     async def _forward_data(self, reader, writer, direction):
         """Forward data between connections"""
         try:
             while True:
-                data = await reader.read(8192)
+                data = await reader.read(65536)
                 if not data:
                     break
                 writer.write(data)
-                await writer.drain()
+                # Only wait on the peer once a real backlog builds up
+                if writer.transport.get_write_buffer_size() > 262144:
+                    await writer.drain()
         except Exception as e:
             logger.debug(f"Forward error ({direction}): {e}")
         finally:
@@ -213,24 +402,30 @@ class PortHopper:
 class HTTPTunnel:
     """HTTP tunnel to bypass HTTP-only firewalls"""
     
-    def __init__(self, config: BypassConfig):
+    def __init__(self, config: BypassConfig, backend_pool: SocksBackendPool = None):
         self.config = config
+        self.backend_pool = backend_pool or SocksBackendPool(config)
         self.obfuscator = TrafficObfuscator(config.obfuscation_key)
     
-    async def start_http_tunnel(self, port_hopper=None):
-        """Start HTTP tunnel server"""
-        app = web.Application()
-        app['port_hopper'] = port_hopper  # Store reference to port hopper
+    def add_routes(self, app: web.Application):
+        """Register the tunnel and decoy endpoints on app"""
         app.router.add_post('/tunnel', self.handle_http_tunnel)
         app.router.add_get('/health', self.health_check)
-        app.router.add_get('/', self.serve_fake_website)
         
         # Add fake endpoints to look legitimate
         app.router.add_get('/api/status', self.fake_api)
         app.router.add_get('/static/{filename}', self.fake_static)
         app.router.add_get('/port-info', self.get_port_info)
+    
+    async def start_http_tunnel(self, port_hopper=None):
+        """Start HTTP tunnel server"""
+        app = web.Application()
+        app['port_hopper'] = port_hopper  # Store reference to port hopper
+        self.add_routes(app)
+        app.router.add_get('/', self.serve_fake_website)
         
-        runner = web.AppRunner(app)
+        # Cancel the tunnel handler when its client goes away, closing the backend
+        runner = web.AppRunner(app, handler_cancellation=True)
         await runner.setup()
         
         site = web.TCPSite(runner, '0.0.0.0', self.config.http_port)
@@ -246,101 +441,88 @@ class HTTPTunnel:
             
             # Deobfuscate if needed
             if self.config.obfuscation_key:
-                data = self.obfuscator.deobfuscate(data)
+                data = await self.obfuscator.deobfuscate_async(data)
             
             # Forward to SOCKS5 proxy
-            reader, writer = await asyncio.open_connection(
-                self.config.socks_host,
-                self.config.socks_port
-            )
+            reader, writer = await self.backend_pool.acquire()
             
             writer.write(data)
             await writer.drain()
-            
-            # Read response
-            response_data = await reader.read(8192)
-            
-            writer.close()
-            await writer.wait_closed()
-            
-            # Obfuscate response if needed
-            if self.config.obfuscation_key:
-                response_data = self.obfuscator.obfuscate(response_data)
-            
-            return web.Response(
-                body=response_data,
-                content_type='application/octet-stream',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'Server': 'nginx/1.18.0'
-                }
-            )
         
         except Exception as e:
             logger.error(f"HTTP tunnel error: {e}")
             return web.Response(status=500, text="Internal Server Error")
+        
+        # Stream the proxy's reply back as it arrives
+        response = web.StreamResponse(headers={
+            'Cache-Control': 'no-cache',
+            'Server': 'nginx/1.18.0'
+        })
+        response.content_type = 'application/octet-stream'
+        
+        try:
+            await response.prepare(request)
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                # Obfuscate response if needed
+                if self.config.obfuscation_key:
+                    chunk = self.obfuscator.obfuscate(chunk)
+                await response.write(chunk)
+            await response.write_eof()
+        except Exception as e:
+            logger.error(f"HTTP tunnel error: {e}")
+        finally:
+            writer.close()
+        
+        return response
     
     async def health_check(self, request):
         """Health check endpoint"""
-        return web.json_response({'status': 'ok', 'service': 'cdn'})
+        return web.Response(body=_HEALTH_JSON, content_type='application/json')
     
     async def serve_fake_website(self, request):
         """Serve fake website to look legitimate"""
-        fake_html = """
-        <!DOCTYPE html>
-        <html>
-        <head><title>CDN Service</title></head>
-        <body>
-        <h1>Content Delivery Network</h1>
-        <p>This is a CDN service for static content delivery.</p>
-        <p>Status: Online</p>
-        </body>
-        </html>
-        """
-        return web.Response(text=fake_html, content_type='text/html')
+        return web.Response(body=_FAKE_HTML, content_type='text/html', charset='utf-8')
     
     async def fake_api(self, request):
         """Fake API endpoint"""
-        return web.json_response({
-            'version': '1.2.3',
-            'status': 'operational',
-            'uptime': time.time(),
-            'endpoints': ['/api/status', '/health', '/static/*']
-        })
+        return web.Response(body=_FAKE_API_JSON, content_type='application/json')
     
     async def fake_static(self, request):
         """Fake static file serving"""
         filename = request.match_info['filename']
         return web.Response(
-            text=f"/* Static file: {filename} */\nbody {{ font-family: Arial; }}",
-            content_type='text/css' if filename.endswith('.css') else 'text/plain'
+            body=b"/* Static file: " + filename.encode() + _FAKE_STATIC_TAIL,
+            content_type='text/css' if filename.endswith('.css') else 'text/plain',
+            charset='utf-8'
         )
     
     async def get_port_info(self, request):
         """Get current port hopping info"""
         port_hopper = request.app.get('port_hopper')
         if port_hopper and port_hopper.current_port:
-            info = {
-                'current_port': port_hopper.current_port,
-                'active_ports': list(port_hopper.servers.keys()),
-                'port_range': port_hopper.config.port_range,
-                'hop_interval': port_hopper.config.hop_interval
-            }
-            return web.json_response(info)
+            return web.Response(body=port_hopper.port_info_json, content_type='application/json')
         else:
             return web.json_response({'current_port': None, 'active_ports': []}, status=404)
 
 class WebSocketTunnel:
     """WebSocket tunnel for real-time communication"""
     
-    def __init__(self, config: BypassConfig):
+    def __init__(self, config: BypassConfig, backend_pool: SocksBackendPool = None):
         self.config = config
+        self.backend_pool = backend_pool or SocksBackendPool(config)
         self.connections = {}
     
+    def add_routes(self, app: web.Application):
+        """Register the WebSocket endpoint on app"""
+        app.router.add_get('/ws', self.websocket_handler)
+    
     async def start_websocket_tunnel(self):
         """Start WebSocket tunnel server"""
         app = web.Application()
-        app.router.add_get('/ws', self.websocket_handler)
+        self.add_routes(app)
         app.router.add_get('/', self.serve_chat_app)
         
         runner = web.AppRunner(app)
@@ -356,14 +538,22 @@ class WebSocketTunnel:
         ws = web.WebSocketResponse()
         await ws.prepare(request)
         
-        connection_id = f"{time.time()}_{random.randint(1000, 9999)}"
+        connection_id = id(ws)
         self.connections[connection_id] = ws
         
+        # One backend connection per WebSocket session, opened on the first message
+        writer = None
+        pump = None
+        
         try:
             async for msg in ws:
                 if msg.type == aiohttp.WSMsgType.BINARY:
                     # Forward binary data to SOCKS5 proxy
-                    await self.forward_to_proxy(msg.data, ws)
+                    if writer is None:
+                        reader, writer = await self.backend_pool.acquire()
+                        pump = asyncio.create_task(self._pump_to_websocket(reader, ws))
+                    writer.write(msg.data)
+                    await writer.drain()
                 elif msg.type == aiohttp.WSMsgType.ERROR:
                     logger.error(f'WebSocket error: {ws.exception()}')
                     break
@@ -371,77 +561,31 @@ class WebSocketTunnel:
         except Exception as e:
             logger.error(f"WebSocket error: {e}")
         finally:
-            if connection_id in self.connections:
-                del self.connections[connection_id]
+            if pump:
+                pump.cancel()
+            if writer:
+                writer.close()
+            self.connections.pop(connection_id, None)
         
         return ws
     
-    async def forward_to_proxy(self, data: bytes, ws):
-        """Forward WebSocket data to SOCKS5 proxy"""
+    async def _pump_to_websocket(self, reader, ws):
+        """Send the proxy's data back over the WebSocket as it arrives"""
         try:
-            reader, writer = await asyncio.open_connection(
-                self.config.socks_host,
-                self.config.socks_port
-            )
-            
-            writer.write(data)
-            await writer.drain()
-            
-            response = await reader.read(8192)
-            
-            writer.close()
-            await writer.wait_closed()
-            
-            # Send response back via WebSocket
-            await ws.send_bytes(response)
-        
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                await ws.send_bytes(chunk)
         except Exception as e:
             logger.error(f"WebSocket proxy forwarding error: {e}")
+        
+        # The backend hung up, so end the session too
+        await ws.close()
     
     async def serve_chat_app(self, request):
         """Serve fake chat application"""
-        chat_html = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Chat Application</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 20px; }
-                #messages { border: 1px solid #ccc; height: 300px; overflow-y: scroll; padding: 10px; }
-                #messageInput { width: 80%; padding: 5px; }
-                #sendButton { padding: 5px 10px; }
-            </style>
-        </head>
-        <body>
-            <h1>Secure Chat</h1>
-            <div id="messages"></div>
-            <input type="text" id="messageInput" placeholder="Type a message...">
-            <button id="sendButton">Send</button>
-            
-            <script>
-                // Fake chat application (non-functional, just for appearance)
-                const messages = document.getElementById('messages');
-                const input = document.getElementById('messageInput');
-                const button = document.getElementById('sendButton');
-                
-                button.onclick = () => {
-                    if (input.value.trim()) {
-                        const div = document.createElement('div');
-                        div.textContent = `You: ${input.value}`;
-                        messages.appendChild(div);
-                        input.value = '';
-                        messages.scrollTop = messages.scrollHeight;
-                    }
-                };
-                
-                input.onkeypress = (e) => {
-                    if (e.key === 'Enter') button.click();
-                };
-            </script>
-        </body>
-        </html>
-        """
-        return web.Response(text=chat_html, content_type='text/html')
+        return web.Response(body=_FAKE_CHAT_HTML, content_type='text/html', charset='utf-8')
 
 class DomainFronting:
     """Domain fronting to bypass SNI-based blocking"""
@@ -455,21 +599,21 @@ class DomainFronting:
             'microsoft.com',
             'fastly.com'
         ]
+        
+        # TLS context for fronts, built once; certificates are not checked
+        # because the front never matches the tunnelled target
+        self._ssl_ctx = ssl.create_default_context()
+        self._ssl_ctx.check_hostname = False
+        self._ssl_ctx.verify_mode = ssl.CERT_NONE
     
     async def create_fronted_connection(self, target_host: str, target_port: int):
         """Create connection using domain fronting"""
         front_domain = random.choice(self.fronting_domains)
         
-        # Create SSL context that will connect to front domain
-        # but send SNI for target domain
-        context = ssl.create_default_context()
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        
         try:
             # Connect to CDN/front domain
             reader, writer = await asyncio.open_connection(
-                front_domain, 443, ssl=context
+                front_domain, 443, ssl=self._ssl_ctx
             )
             
             # Send HTTP CONNECT request for target
@@ -498,19 +642,45 @@ class BypassServer:
     
     def __init__(self, config: BypassConfig):
         self.config = config
-        self.port_hopper = PortHopper(config)
-        self.http_tunnel = HTTPTunnel(config)
-        self.websocket_tunnel = WebSocketTunnel(config)
+        self.backend_pool = SocksBackendPool(config)
+        self.port_hopper = PortHopper(config, self.backend_pool)
+        self.http_tunnel = HTTPTunnel(config, self.backend_pool)
+        self.websocket_tunnel = WebSocketTunnel(config, self.backend_pool)
         self.domain_fronting = DomainFronting(config)
     
+    async def start_web_tunnels(self):
+        """Serve the HTTP and WebSocket tunnels from one application"""
+        app = web.Application()
+        app['port_hopper'] = self.port_hopper  # Store reference to port hopper
+        self.http_tunnel.add_routes(app)
+        self.websocket_tunnel.add_routes(app)
+        app.router.add_get('/', self.serve_index)
+        
+        # Cancel the tunnel handler when its client goes away, closing the backend
+        runner = web.AppRunner(app, handler_cancellation=True)
+        await runner.setup()
+        
+        # One runner, one listening site per tunnel port
+        for port in (self.config.http_port, self.config.websocket_port):
+            await web.TCPSite(runner, '0.0.0.0', port).start()
+        
+        logger.info(f"HTTP tunnel started on port {self.config.http_port}")
+        logger.info(f"WebSocket tunnel started on port {self.config.websocket_port}")
+    
+    async def serve_index(self, request):
+        """Serve the decoy page belonging to the port the request came in on"""
+        sockname = request.transport.get_extra_info('sockname') if request.transport else None
+        if sockname and sockname[1] == self.config.websocket_port:
+            return await self.websocket_tunnel.serve_chat_app(request)
+        return await self.http_tunnel.serve_fake_website(request)
+    
     async def start_all_bypasses(self):
         """Start all bypass methods"""
         logger.info("Starting all bypass methods...")
         
         tasks = [
             asyncio.create_task(self.port_hopper.start_hopping()),
-            asyncio.create_task(self.http_tunnel.start_http_tunnel(self.port_hopper)),
-            asyncio.create_task(self.websocket_tunnel.start_websocket_tunnel()),
+            asyncio.create_task(self.start_web_tunnels()),
         ]
         
         # Start initial port hop
@@ -528,15 +698,16 @@ def load_bypass_config():
     """Load bypass configuration"""
     config = BypassConfig()
     
-    # Load from environment or config file
-    if os.path.exists('config/proxy.env'):
-        with open('config/proxy.env', 'r') as f:
+    # Load from environment or config file; only the admin password is used
+    try:
+        with open('config/proxy.env', 'rb') as f:
             for line in f:
                 line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    if key == 'ADMIN_PASSWORD':
-                        config.socks_password = value
+                if line.startswith(b'ADMIN_PASSWORD='):
+                    config.socks_password = line[len(b'ADMIN_PASSWORD='):].decode()
+                    break
+    except FileNotFoundError:
+        pass
     
     # Override with environment variables
     config.socks_host = os.getenv('SOCKS_HOST', config.socks_host)
@@ -549,7 +720,7 @@ def load_bypass_config():
     
     # Generate obfuscation key if not provided
     if not config.obfuscation_key:
-        config.obfuscation_key = Fernet.generate_key()
+        config.obfuscation_key = generate_obfuscation_key()
     
     return config
 
@@ -566,4 +737,6 @@ async def main():
         logger.error(f"Bypass server error: {e}")
 
 if __name__ == '__main__':
+    # Use uvloop for better performance
+    uvloop.install()
     asyncio.run(main()) 
\ No newline at end of file
@@ -9,52 +9,40 @@ import struct
 import os
 import time
 
+# SOCKS5 greeting offering "no auth", and the 2-byte method reply
+_HANDSHAKE = struct.pack('!BBB', 5, 1, 0)
+_RESPONSE = struct.Struct('!BB')
+
 def check_socks5_health(host='localhost', port=1080, timeout=3, retries=2):
     """Check if SOCKS5 proxy is responding correctly"""
     for attempt in range(retries + 1):
-        sock = None
         try:
-            # Create socket connection
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
-            
-            # Connect to proxy
-            sock.connect((host, port))
-            
-            # Send SOCKS5 handshake (no auth method)
-            handshake = struct.pack('!BBB', 5, 1, 0)
-            sock.send(handshake)
-            
-            # Receive response
-            response = sock.recv(2)
-            if len(response) != 2:
-                sock.close()
-                if attempt < retries:
-                    time.sleep(0.5)
-                    continue
-                return False
-            
-            version, method = struct.unpack('!BB', response)
-            
-            # Check if proxy accepted our handshake
-            if version == 5 and method in (0, 2):  # No auth or username/password
-                sock.close()
-                return True
-            
-            sock.close()
-            if attempt < retries:
-                time.sleep(0.5)
-                continue
-            return False
+            # Create socket connection; closed on every exit path
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                
+                # Connect to proxy
+                sock.connect((host, port))
+                
+                # Send SOCKS5 handshake (no auth method)
+                sock.sendall(_HANDSHAKE)
+                
+                # Receive response
+                response = sock.recv(2)
             
-        except Exception as e:
-            if sock:
-                sock.close()
-            if attempt < retries:
-                time.sleep(0.5)
-                continue
+            if len(response) == 2:
+                version, method = _RESPONSE.unpack(response)
+                
+                # Check if proxy accepted our handshake
+                if version == 5 and method in (0, 2):  # No auth or username/password
+                    return True
+        
+        except Exception:
             # Don't print errors for health checks to avoid log spam
-            return False
+            pass
+        
+        if attempt < retries:
+            time.sleep(0.5)
     
     return False
 
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of the detected server IP, shared by the bypass client and check-connection.py
+"""
+
+import ipaddress
+import os
+import time
+from typing import Optional
+
+SERVER_IP_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'tg-socks5', 'server_ip')
+SERVER_IP_CACHE_TTL = 600  # seconds
+
+def valid_ip(text: str) -> Optional[str]:
+    """Return text as a normalized IP address, or None if it isn't one"""
+    try:
+        return str(ipaddress.ip_address(text.strip()))
+    except ValueError:
+        return None
+
+def read_cached_ip() -> Optional[str]:
+    """Return the cached server IP if it is still fresh"""
+    try:
+        if time.time() - os.path.getmtime(SERVER_IP_CACHE_FILE) < SERVER_IP_CACHE_TTL:
+            with open(SERVER_IP_CACHE_FILE, 'r') as f:
+                return valid_ip(f.read())
+    except OSError:
+        pass
+    return None
+
+def write_cached_ip(ip: str):
+    """Store the detected server IP for later runs; anything else is not cached"""
+    ip = valid_ip(ip)
+    if not ip:
+        return
+    try:
+        os.makedirs(os.path.dirname(SERVER_IP_CACHE_FILE), exist_ok=True)
+        with open(SERVER_IP_CACHE_FILE, 'w') as f:
+            f.write(ip)
+    except OSError:
+        pass
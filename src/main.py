@@ -5,21 +5,28 @@ Features: Rate limiting, encryption, authentication, monitoring
 """
 
 import asyncio
+import bisect
+import ipaddress
 import socket
 import struct
 import logging
+import math
 import time
+import functools
 import hashlib
 import hmac
 import os
 import signal
 import json
-from typing import Dict, Set, Optional, Tuple
-from dataclasses import dataclass
-from collections import defaultdict, deque
+import multiprocessing
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from dataclasses import dataclass, replace
 import uvloop
 from cryptography.fernet import Fernet
-from prometheus_client import Counter, Histogram, Gauge, start_http_server
+from prometheus_client import Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from relay import SPLICE_AVAILABLE, dup_socket, recv_into_data, splice_data, take_buffered
 
 # Configure logging with security considerations
 logging.basicConfig(
@@ -32,11 +39,30 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Metrics
-CONNECTION_COUNTER = Counter('socks5_connections_total', 'Total connections')
+# Metrics (connection and rate limit counts are plain ints read at scrape time)
 REQUEST_HISTOGRAM = Histogram('socks5_request_duration_seconds', 'Request duration')
-ACTIVE_CONNECTIONS = Gauge('socks5_active_connections', 'Active connections')
-RATE_LIMIT_HITS = Counter('socks5_rate_limit_hits_total', 'Rate limit violations')
+
+# Resolved Telegram hostnames (seconds, entries)
+DNS_CACHE_TTL = 60
+DNS_CACHE_SIZE = 1024
+
+# Fixed SOCKS5 wire formats
+_S_BB = struct.Struct('!BB')
+_S_BBBB = struct.Struct('!BBBB')
+_S_H = struct.Struct('!H')
+_S_REPLY = struct.Struct('!BBBBIH')
+
+# Precomputed method selection, auth and request replies
+_METHOD_NO_AUTH = _S_BB.pack(5, 0)
+_METHOD_USERPASS = _S_BB.pack(5, 2)
+_METHOD_REJECTED = _S_BB.pack(5, 0xFF)
+_AUTH_SUCCESS = _S_BB.pack(1, 0)
+_AUTH_FAILURE = _S_BB.pack(1, 1)
+_REPLY_SUCCEEDED = _S_REPLY.pack(5, 0, 0, 1, 0, 0)
+_REPLY_GENERAL_FAILURE = _S_REPLY.pack(5, 1, 0, 1, 0, 0)
+_REPLY_NOT_ALLOWED = _S_REPLY.pack(5, 2, 0, 1, 0, 0)
+_REPLY_CMD_UNSUPPORTED = _S_REPLY.pack(5, 7, 0, 1, 0, 0)
+_REPLY_ATYP_UNSUPPORTED = _S_REPLY.pack(5, 8, 0, 1, 0, 0)
 
 @dataclass
 class ProxyConfig:
@@ -48,17 +74,26 @@ class ProxyConfig:
     rate_limit_window: int = 60  # seconds
     auth_required: bool = True
     encryption_key: Optional[bytes] = None
-    telegram_domains: Set[str] = None
+    telegram_domains: FrozenSet[str] = None  # exact hosts
+    telegram_suffixes: Tuple[str, ...] = None  # defaults to subdomains of telegram_domains
+    telegram_cidrs: Tuple[str, ...] = None
     metrics_port: int = 8080
+    relay_backend: str = 'auto'  # 'auto', 'splice' or 'copy'
+    workers: int = 1  # server processes sharing the port via SO_REUSEPORT
 
     def __post_init__(self):
         if self.telegram_domains is None:
-            self.telegram_domains = {
+            self.telegram_domains = frozenset({
                 'api.telegram.org',
                 'core.telegram.org',
                 'web.telegram.org',
                 'desktop.telegram.org',
-                'updates.tdesktop.com',
+                'updates.tdesktop.com'
+            })
+        if self.telegram_suffixes is None:
+            self.telegram_suffixes = tuple('.' + domain for domain in self.telegram_domains)
+        if self.telegram_cidrs is None:
+            self.telegram_cidrs = (
                 '149.154.160.0/20',
                 '91.108.4.0/22',
                 '91.108.8.0/22',
@@ -66,19 +101,22 @@ class ProxyConfig:
                 '91.108.16.0/22',
                 '91.108.20.0/22',
                 '91.108.56.0/22',
-                '149.154.160.0/20',
                 '149.154.164.0/22',
                 '149.154.168.0/22',
                 '149.154.172.0/22'
-            }
+            )
 
 class RateLimiter:
-    """Rate limiter with sliding window"""
+    """Rate limiter with a token bucket per IP"""
     
-    def __init__(self, max_requests: int, window_seconds: int):
+    def __init__(self, max_requests: int, window_seconds: int, max_tracked_ips: int = 10000):
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-        self.requests: Dict[str, deque] = defaultdict(deque)
+        self.refill_rate = max_requests / window_seconds  # tokens per second
+        self.max_tracked_ips = max_tracked_ips
+        # client key -> (tokens, time of last update), least recently seen first
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        self.hits = 0  # requests rejected so far
     
     def is_allowed(self, client_ip: str) -> bool:
         """Check if request is allowed under rate limit"""
@@ -86,75 +124,140 @@ class RateLimiter:
         if client_ip in ('127.0.0.1', '::1', 'localhost'):
             return True
         
-        now = time.time()
-        client_requests = self.requests[client_ip]
-        
-        # Remove old requests outside the window
-        while client_requests and client_requests[0] <= now - self.window_seconds:
-            client_requests.popleft()
+        key = self._client_key(client_ip)
+        now = time.monotonic()
+        # Popping and re-inserting keeps the dict in least-recently-seen order
+        bucket = self.buckets.pop(key, None)
+        if bucket is None:
+            if len(self.buckets) >= self.max_tracked_ips:
+                self._sweep(now)
+                if len(self.buckets) >= self.max_tracked_ips:
+                    del self.buckets[next(iter(self.buckets))]
+            tokens = self.max_requests
+        else:
+            tokens, last = bucket
+            tokens = min(self.max_requests, tokens + (now - last) * self.refill_rate)
         
-        if len(client_requests) >= self.max_requests:
-            RATE_LIMIT_HITS.inc()
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            self.hits += 1
             return False
         
-        client_requests.append(now)
+        self.buckets[key] = (tokens - 1, now)
         return True
+    
+    @staticmethod
+    def _client_key(client_ip: str) -> str:
+        """Bucket key for a client; IPv6 clients share a bucket per /64"""
+        if ':' not in client_ip:
+            return client_ip
+        try:
+            prefix = ipaddress.IPv6Address(client_ip).exploded[:19]
+        except ValueError:
+            return client_ip
+        return prefix + '::/64'
+    
+    def _sweep(self, now: float):
+        """Forget IPs whose bucket has refilled completely"""
+        full = [ip for ip, (tokens, last) in self.buckets.items()
+                if tokens + (now - last) * self.refill_rate >= self.max_requests]
+        for ip in full:
+            del self.buckets[ip]
+
+def _hash_password(password: bytes) -> bytes:
+    """SHA-256 digest of a password"""
+    return hashlib.sha256(password).digest()
 
 class AuthManager:
     """Authentication and authorization manager"""
     
     def __init__(self, config: ProxyConfig):
         self.config = config
-        self.auth_tokens = self._load_auth_tokens()
+        # Per-process HMAC key; the keyed inner/outer pad state is computed
+        # once here and copied for every lookup
+        self._mac = hmac.new(os.urandom(32), digestmod=hashlib.sha256)
+        self.auth_tokens = {username: self._keyed(digest)
+                            for username, digest in self._load_auth_tokens().items()}
         self.encryption_key = config.encryption_key or Fernet.generate_key()
         self.cipher = Fernet(self.encryption_key)
     
-    def _load_auth_tokens(self) -> Dict[str, str]:
-        """Load authentication tokens from environment or config"""
+    def _load_auth_tokens(self) -> Dict[str, bytes]:
+        """Load authentication tokens (raw SHA-256 digests) from environment or config"""
         tokens = {}
         auth_data = os.getenv('PROXY_AUTH_TOKENS')
         if auth_data:
             try:
-                tokens = json.loads(auth_data)
-            except json.JSONDecodeError:
+                for username, hex_digest in json.loads(auth_data).items():
+                    tokens[username] = bytes.fromhex(hex_digest)
+            except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
                 logger.error("Invalid auth tokens format")
+                tokens = {}
         
         # Default admin token if none provided
         if not tokens:
             # Try to use ADMIN_PASSWORD first, then fallback to ADMIN_TOKEN
             admin_password = os.getenv('ADMIN_PASSWORD')
             if admin_password:
-                tokens['admin'] = hashlib.sha256(admin_password.encode()).hexdigest()
+                tokens['admin'] = _hash_password(admin_password.encode())
             else:
                 admin_token = os.getenv('ADMIN_TOKEN', 'default_admin_token_change_me')
-                tokens['admin'] = hashlib.sha256(admin_token.encode()).hexdigest()
+                tokens['admin'] = _hash_password(admin_token.encode())
         
         return tokens
     
+    def _keyed(self, digest: bytes) -> bytes:
+        """HMAC-SHA256 of a password digest under the per-process key"""
+        mac = self._mac.copy()
+        mac.update(digest)
+        return mac.digest()
+    
     def authenticate(self, username: str, password: str) -> bool:
         """Authenticate user credentials"""
         if not self.config.auth_required:
             return True
         
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        return self.auth_tokens.get(username) == password_hash
+        password_mac = self._keyed(_hash_password(password.encode()))
+        return hmac.compare_digest(self.auth_tokens.get(username, b''), password_mac)
+
+class _ServerCollector:
+    """Exports the server's plain connection counters when Prometheus scrapes"""
+    
+    def __init__(self, server: 'SOCKS5Server'):
+        self.server = server
+    
+    def collect(self):
+        yield CounterMetricFamily('socks5_connections', 'Total connections',
+                                  value=self.server.connections_total)
+        yield GaugeMetricFamily('socks5_active_connections', 'Active connections',
+                                value=self.server.connections_active)
+        yield CounterMetricFamily('socks5_rate_limit_hits', 'Rate limit violations',
+                                  value=self.server.rate_limiter.hits)
 
 class SOCKS5Server:
     """Secure SOCKS5 Proxy Server"""
     
     SOCKS_VERSION = 5
+    RATE_LIMIT_EXEMPT = frozenset({'127.0.0.1', '::1', 'localhost'})
+    RATE_LIMIT_EXEMPT_PREFIXES = ('172.', '10.', '127.')
     
     def __init__(self, config: ProxyConfig):
         self.config = config
         self.rate_limiter = RateLimiter(config.rate_limit_per_ip, config.rate_limit_window)
         self.auth_manager = AuthManager(config)
-        self.active_connections: Set[asyncio.Task] = set()
+        self._compile_telegram_allowlist()
+        # Clients keep connecting to the same few hosts and DC addresses
+        self._is_telegram_address = functools.lru_cache(maxsize=4096)(self._is_telegram_address)
+        self.use_splice = self._select_relay_backend()
+        self._dns_cache: Dict[str, Tuple[float, List[str]]] = {}
+        self.connections_total = 0
+        self.connections_active = 0
         self.server = None
         self.shutdown_event = asyncio.Event()
     
     async def start(self):
         """Start the SOCKS5 server"""
         # Start metrics server
+        REGISTRY.register(_ServerCollector(self))
         start_http_server(self.config.metrics_port)
         logger.info(f"Metrics server started on port {self.config.metrics_port}")
         
@@ -163,18 +266,27 @@ class SOCKS5Server:
             self.handle_client,
             self.config.host,
             self.config.port,
-            limit=self.config.max_connections
+            limit=self.config.max_connections,
+            reuse_port=self.config.workers > 1
         )
         
         logger.info(f"SOCKS5 proxy started on {self.config.host}:{self.config.port}")
         
-        # Setup signal handlers
+        # Setup signal handlers on the event loop so shutdown wakes it immediately
+        loop = asyncio.get_running_loop()
         for sig in (signal.SIGTERM, signal.SIGINT):
-            signal.signal(sig, self._signal_handler)
+            loop.add_signal_handler(sig, self._signal_handler, sig)
         
-        await self.server.serve_forever()
+        serving = asyncio.create_task(self.server.serve_forever())
+        stopping = asyncio.create_task(self.shutdown_event.wait())
+        try:
+            await asyncio.wait((serving, stopping), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            serving.cancel()
+            stopping.cancel()
+            self.server.close()
     
-    def _signal_handler(self, signum, frame):
+    def _signal_handler(self, signum: int):
         """Handle shutdown signals"""
         logger.info(f"Received signal {signum}, shutting down...")
         self.shutdown_event.set()
@@ -185,24 +297,23 @@ class SOCKS5Server:
         client_ip = client_addr[0] if client_addr else 'unknown'
         
         # Rate limiting (skip for localhost/health checks and Docker internal IPs)
-        exempt_ips = ('127.0.0.1', '::1', 'localhost')
-        is_docker_internal = client_ip.startswith('172.') or client_ip.startswith('10.')
-        
-        if client_ip not in exempt_ips and not is_docker_internal and not self.rate_limiter.is_allowed(client_ip):
+        if not (client_ip in self.RATE_LIMIT_EXEMPT
+                or client_ip.startswith(self.RATE_LIMIT_EXEMPT_PREFIXES)
+                or self.rate_limiter.is_allowed(client_ip)):
             logger.warning(f"Rate limit exceeded for {client_ip}")
             writer.close()
             await writer.wait_closed()
             return
         
-        CONNECTION_COUNTER.inc()
-        ACTIVE_CONNECTIONS.inc()
+        self.connections_total += 1
+        self.connections_active += 1
         
         try:
             await self._handle_socks5_handshake(reader, writer, client_ip)
         except Exception as e:
             logger.error(f"Error handling client {client_ip}: {e}")
         finally:
-            ACTIVE_CONNECTIONS.dec()
+            self.connections_active -= 1
             writer.close()
             await writer.wait_closed()
     
@@ -210,28 +321,28 @@ class SOCKS5Server:
                                       writer: asyncio.StreamWriter, client_ip: str):
         """Handle SOCKS5 handshake protocol"""
         
-        # Read initial handshake
-        data = await reader.read(262)  # Maximum initial handshake size
-        if len(data) < 3:
-            return
-        
-        version, nmethods = struct.unpack('!BB', data[:2])
-        if version != self.SOCKS_VERSION:
+        # Read initial handshake by length prefix so pipelined auth and
+        # CONNECT bytes stay buffered for the next steps
+        try:
+            version, nmethods = await reader.readexactly(2)
+            if version != self.SOCKS_VERSION or nmethods == 0:
+                return
+            
+            methods = list(await reader.readexactly(nmethods))
+        except asyncio.IncompleteReadError:
             return
         
-        methods = list(data[2:2+nmethods])
-        
         # Determine authentication method
         if self.config.auth_required:
             if 2 not in methods:  # Username/password auth
-                writer.write(struct.pack('!BB', self.SOCKS_VERSION, 0xFF))
+                writer.write(_METHOD_REJECTED)
                 await writer.drain()
                 return
             # Accept username/password authentication
-            writer.write(struct.pack('!BB', self.SOCKS_VERSION, 2))
+            writer.write(_METHOD_USERPASS)
         else:
             # No authentication required
-            writer.write(struct.pack('!BB', self.SOCKS_VERSION, 0))
+            writer.write(_METHOD_NO_AUTH)
         
         await writer.drain()
         
@@ -246,95 +357,78 @@ class SOCKS5Server:
     async def _handle_authentication(self, reader: asyncio.StreamReader, 
                                    writer: asyncio.StreamWriter) -> bool:
         """Handle username/password authentication"""
-        data = await reader.read(513)  # Max auth request size
-        if len(data) < 3:
-            return False
-        
-        version = data[0]
-        if version != 1:  # Username/password auth version
-            return False
-        
-        username_len = data[1]
-        if len(data) < 2 + username_len + 1:
-            return False
-        
-        username = data[2:2+username_len].decode('utf-8', errors='ignore')
-        password_len = data[2+username_len]
-        
-        if len(data) < 2 + username_len + 1 + password_len:
+        # Read by length prefix so a pipelined CONNECT request stays buffered
+        try:
+            version, username_len = await reader.readexactly(2)
+            if version != 1:  # Username/password auth version
+                return False
+            
+            username = (await reader.readexactly(username_len)).decode('utf-8', errors='ignore')
+            password_len = (await reader.readexactly(1))[0]
+            password = (await reader.readexactly(password_len)).decode('utf-8', errors='ignore')
+        except asyncio.IncompleteReadError:
             return False
         
-        password = data[2+username_len+1:2+username_len+1+password_len].decode('utf-8', errors='ignore')
-        
         # Authenticate
         if self.auth_manager.authenticate(username, password):
-            writer.write(struct.pack('!BB', 1, 0))  # Success
+            writer.write(_AUTH_SUCCESS)
             await writer.drain()
             return True
         else:
-            writer.write(struct.pack('!BB', 1, 1))  # Failure
+            writer.write(_AUTH_FAILURE)
             await writer.drain()
             return False
     
     async def _handle_socks5_request(self, reader: asyncio.StreamReader, 
                                    writer: asyncio.StreamWriter, client_ip: str):
         """Handle SOCKS5 connection request"""
-        with REQUEST_HISTOGRAM.time():
-            data = await reader.read(262)
-            if len(data) < 10:
-                return
-            
-            version, cmd, reserved, addr_type = struct.unpack('!BBBB', data[:4])
-            
-            if version != self.SOCKS_VERSION or cmd != 1:  # Only CONNECT supported
-                reply = struct.pack('!BBBBIH', self.SOCKS_VERSION, 7, 0, 1, 0, 0)
-                writer.write(reply)
-                await writer.drain()
-                return
-            
-            # Parse address
-            if addr_type == 1:  # IPv4
-                if len(data) < 10:
-                    return
-                addr = socket.inet_ntoa(data[4:8])
-                port = struct.unpack('!H', data[8:10])[0]
-            elif addr_type == 3:  # Domain name
-                if len(data) < 5:
-                    return
-                addr_len = data[4]
-                if len(data) < 5 + addr_len + 2:
+        started = time.monotonic()
+        try:
+            try:
+                version, cmd, reserved, addr_type = _S_BBBB.unpack(await reader.readexactly(4))
+                
+                if version != self.SOCKS_VERSION or cmd != 1:  # Only CONNECT supported
+                    writer.write(_REPLY_CMD_UNSUPPORTED)
+                    await writer.drain()
                     return
-                addr = data[5:5+addr_len].decode('utf-8', errors='ignore')
-                port = struct.unpack('!H', data[5+addr_len:5+addr_len+2])[0]
-            elif addr_type == 4:  # IPv6
-                if len(data) < 22:
+                
+                # Parse address
+                if addr_type == 1:  # IPv4
+                    data = await reader.readexactly(4 + 2)
+                    addr = socket.inet_ntoa(data[:4])
+                    port = _S_H.unpack_from(data, 4)[0]
+                elif addr_type == 3:  # Domain name
+                    addr_len = (await reader.readexactly(1))[0]
+                    data = await reader.readexactly(addr_len + 2)
+                    addr = data[:addr_len].decode('utf-8', errors='ignore')
+                    port = _S_H.unpack_from(data, addr_len)[0]
+                elif addr_type == 4:  # IPv6
+                    data = await reader.readexactly(16 + 2)
+                    addr = socket.inet_ntop(socket.AF_INET6, data[:16])
+                    port = _S_H.unpack_from(data, 16)[0]
+                else:
+                    writer.write(_REPLY_ATYP_UNSUPPORTED)
+                    await writer.drain()
                     return
-                addr = socket.inet_ntop(socket.AF_INET6, data[4:20])
-                port = struct.unpack('!H', data[20:22])[0]
-            else:
-                reply = struct.pack('!BBBBIH', self.SOCKS_VERSION, 8, 0, 1, 0, 0)
-                writer.write(reply)
-                await writer.drain()
+            except asyncio.IncompleteReadError:
                 return
             
             # Security check: only allow Telegram domains/IPs
             if not self._is_telegram_address(addr):
                 logger.warning(f"Blocked non-Telegram address: {addr} from {client_ip}")
-                reply = struct.pack('!BBBBIH', self.SOCKS_VERSION, 2, 0, 1, 0, 0)
-                writer.write(reply)
+                writer.write(_REPLY_NOT_ALLOWED)
                 await writer.drain()
                 return
             
             # Establish connection to target
             try:
                 target_reader, target_writer = await asyncio.wait_for(
-                    asyncio.open_connection(addr, port),
+                    self._open_target(addr, port),
                     timeout=10.0
                 )
                 
                 # Send success response
-                reply = struct.pack('!BBBBIH', self.SOCKS_VERSION, 0, 0, 1, 0, 0)
-                writer.write(reply)
+                writer.write(_REPLY_SUCCEEDED)
                 await writer.drain()
                 
                 # Start data relay
@@ -342,89 +436,159 @@ class SOCKS5Server:
                 
             except Exception as e:
                 logger.error(f"Connection failed to {addr}:{port} - {e}")
-                reply = struct.pack('!BBBBIH', self.SOCKS_VERSION, 1, 0, 1, 0, 0)
-                writer.write(reply)
+                writer.write(_REPLY_GENERAL_FAILURE)
                 await writer.drain()
+        finally:
+            REQUEST_HISTOGRAM.observe(time.monotonic() - started)
+    
+    async def _open_target(self, addr: str, port: int):
+        """Connect to the target, resolving hostnames through the DNS cache"""
+        if ':' in addr or addr[-1:].isdigit():
+            return await asyncio.open_connection(addr, port)
+        
+        error = OSError(f"No addresses for {addr}")
+        for host in await self._resolve(addr, port):
+            try:
+                return await asyncio.open_connection(host, port)
+            except OSError as e:
+                error = e
+        raise error
+    
+    async def _resolve(self, host: str, port: int) -> List[str]:
+        """Resolve host to IP addresses, caching answers for DNS_CACHE_TTL seconds"""
+        now = time.monotonic()
+        cached = self._dns_cache.get(host)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        if len(self._dns_cache) >= DNS_CACHE_SIZE:
+            self._dns_cache.clear()
+        self._dns_cache[host] = (now + DNS_CACHE_TTL, addresses)
+        return addresses
+    
+    def _select_relay_backend(self) -> bool:
+        """Decide whether relays use splice(2) or the asyncio copy loop"""
+        backend = self.config.relay_backend
+        if backend == 'copy':
+            return False
+        if backend not in ('auto', 'splice'):
+            logger.warning(f"Unknown relay backend {backend!r}, using auto")
+        elif backend == 'splice' and not SPLICE_AVAILABLE:
+            logger.warning("splice(2) not available, using the copy relay")
+        return SPLICE_AVAILABLE
+    
+    def _compile_telegram_allowlist(self):
+        """Compile the allowlist's CIDRs into sorted IPv4 ranges"""
+        self._telegram_hosts = frozenset(self.config.telegram_domains)
+        self._telegram_suffixes = tuple(self.config.telegram_suffixes)
+        
+        networks = []
+        for cidr in self.config.telegram_cidrs:
+            try:
+                networks.append(ipaddress.ip_network(cidr, strict=False))
+            except ValueError:
+                logger.warning(f"Ignoring invalid Telegram network {cidr}")
+        
+        # Merged, sorted ranges as integers for bisect lookups, per address family
+        self._telegram_ranges = {}
+        for family, version in ((socket.AF_INET, 4), (socket.AF_INET6, 6)):
+            merged = ipaddress.collapse_addresses(n for n in networks if n.version == version)
+            ranges = [(int(n.network_address), int(n.broadcast_address)) for n in merged]
+            self._telegram_ranges[family] = ([start for start, _ in ranges],
+                                             [end for _, end in ranges])
     
     def _is_telegram_address(self, addr: str) -> bool:
         """Check if address is allowed for Telegram"""
         # Check exact domain matches
-        if addr in self.config.telegram_domains:
+        if addr in self._telegram_hosts:
             return True
         
         # Check if it's a Telegram subdomain
-        for domain in self.config.telegram_domains:
-            if not domain.startswith('*.') and addr.endswith('.' + domain):
-                return True
+        if addr.endswith(self._telegram_suffixes):
+            return True
+        
+        # Check IP ranges; only IPv6 literals contain ':' and hostnames never
+        # end in a digit, so domain names skip parsing altogether
+        if ':' in addr:
+            family = socket.AF_INET6
+        elif addr[-1:].isdigit():
+            family = socket.AF_INET
+        else:
+            return False
         
-        # Check IP ranges (simplified check)
         try:
-            import ipaddress
-            ip = ipaddress.ip_address(addr)
-            for cidr in self.config.telegram_domains:
-                if '/' in cidr:
-                    try:
-                        network = ipaddress.ip_network(cidr, strict=False)
-                        if ip in network:
-                            return True
-                    except ValueError:
-                        continue
-        except ValueError:
-            pass
+            ip = int.from_bytes(socket.inet_pton(family, addr), 'big')
+        except OSError:
+            return False
         
-        return False
+        starts, ends = self._telegram_ranges[family]
+        idx = bisect.bisect_right(starts, ip) - 1
+        return idx >= 0 and ip <= ends[idx]
     
-    async def _relay_data(self, client_reader: asyncio.StreamReader, 
-                         client_writer: asyncio.StreamWriter,
-                         target_reader: asyncio.StreamReader, 
-                         target_writer: asyncio.StreamWriter,
-                         client_ip: str):
-        """Relay data between client and target with encryption support"""
+    async def _socket_relay(self, client_reader: asyncio.StreamReader,
+                            client_writer: asyncio.StreamWriter,
+                            target_reader: asyncio.StreamReader,
+                            target_writer: asyncio.StreamWriter,
+                            client_ip: str, pump):
+        """Relay data between client and target directly on the sockets with pump"""
+        # Stop both transports reading; from here on the sockets are read directly
+        client_writer.transport.pause_reading()
+        target_writer.transport.pause_reading()
         
-        async def copy_data(reader, writer, direction):
-            try:
-                while True:
-                    data = await reader.read(8192)
-                    if not data:
-                        break
+        try:
+            # Collect anything that arrived before the switch. Draining a reader
+            # that had paused its transport for flow control resumes it, so
+            # pause both again before anything can be read into a finished reader
+            pending = [(await take_buffered(client_reader), target_writer),
+                       (await take_buffered(target_reader), client_writer)]
+            client_writer.transport.pause_reading()
+            target_writer.transport.pause_reading()
+            
+            for data, writer in pending:
+                if data:
                     writer.write(data)
                     await writer.drain()
-            except Exception as e:
-                logger.debug(f"Relay error ({direction}): {e}")
-            finally:
-                writer.close()
-        
-        # Start bidirectional data relay
-        tasks = [
-            asyncio.create_task(copy_data(client_reader, target_writer, f"{client_ip}->target")),
-            asyncio.create_task(copy_data(target_reader, client_writer, f"target->{client_ip}"))
-        ]
-        
-        try:
-            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            
+            # Each pump shuts down its far side on EOF, which ends the other one
+            client_sock = dup_socket(client_writer)
+            target_sock = dup_socket(target_writer)
+            with client_sock, target_sock:
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(pump(client_sock, target_sock, f"{client_ip}->target"))
+                    tg.create_task(pump(target_sock, client_sock, f"target->{client_ip}"))
         except Exception as e:
             logger.error(f"Relay error: {e}")
         finally:
-            for task in tasks:
-                task.cancel()
             target_writer.close()
             await target_writer.wait_closed()
+    
+    async def _relay_data(self, client_reader: asyncio.StreamReader, 
+                         client_writer: asyncio.StreamWriter,
+                         target_reader: asyncio.StreamReader, 
+                         target_writer: asyncio.StreamWriter,
+                         client_ip: str):
+        """Relay data between client and target with encryption support"""
+        pump = splice_data if self.use_splice else recv_into_data
+        await self._socket_relay(client_reader, client_writer,
+                                 target_reader, target_writer, client_ip, pump)
 
-async def main():
-    """Main entry point"""
-    # Load configuration from environment
-    config = ProxyConfig(
+def load_config() -> ProxyConfig:
+    """Load configuration from environment"""
+    return ProxyConfig(
         host=os.getenv('PROXY_HOST', '0.0.0.0'),
         port=int(os.getenv('PROXY_PORT', '1080')),
         max_connections=int(os.getenv('MAX_CONNECTIONS', '1000')),
         rate_limit_per_ip=int(os.getenv('RATE_LIMIT_PER_IP', '10')),
         auth_required=os.getenv('AUTH_REQUIRED', 'true').lower() == 'true',
-        metrics_port=int(os.getenv('METRICS_PORT', '8080'))
+        metrics_port=int(os.getenv('METRICS_PORT', '8080')),
+        relay_backend=os.getenv('PROXY_IO_BACKEND', 'auto').lower(),
+        workers=max(1, int(os.getenv('PROXY_WORKERS', '1')))
     )
-    
-    # Use uvloop for better performance
-    uvloop.install()
-    
+
+async def main(config: ProxyConfig):
+    """Run one proxy server until shutdown"""
     server = SOCKS5Server(config)
     
     try:
@@ -438,5 +602,45 @@ async def main():
             server.server.close()
             await server.server.wait_closed()
 
+def run_worker(config: ProxyConfig):
+    """Run a server on its own uvloop event loop"""
+    uvloop.install()
+    asyncio.run(main(config))
+
+def run_workers(config: ProxyConfig):
+    """Run one server process per worker, all listening on the same port"""
+    # SO_REUSEPORT spreads one client's connections over all workers, each with
+    # its own rate limiter, so every worker gets a share of the per-IP limit
+    worker_rate_limit = math.ceil(config.rate_limit_per_ip / config.workers)
+    
+    # Each worker exports its own metrics on metrics_port + worker index
+    processes = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(replace(config, metrics_port=config.metrics_port + index,
+                          rate_limit_per_ip=worker_rate_limit),),
+            name=f"socks5-worker-{index}"
+        )
+        for index in range(config.workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {config.workers} workers on {config.host}:{config.port}")
+    
+    def stop_workers(signum, frame):
+        logger.info(f"Received signal {signum}, stopping workers...")
+        for process in processes:
+            process.terminate()
+    
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, stop_workers)
+    
+    for process in processes:
+        process.join()
+
 if __name__ == '__main__':
-    asyncio.run(main()) 
\ No newline at end of file
+    config = load_config()
+    if config.workers > 1:
+        run_workers(config)
+    else:
+        run_worker(config)
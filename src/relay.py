@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Socket-level relay pumps shared by the SOCKS5 proxy and the bypass server
+"""
+
+import asyncio
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+# splice(2) moves bytes between sockets through a kernel pipe (Linux only)
+SPLICE_AVAILABLE = hasattr(os, 'splice')
+
+def dup_socket(writer: asyncio.StreamWriter) -> socket.socket:
+    """Duplicate the socket behind writer; the transport keeps its own"""
+    return socket.socket(fileno=os.dup(writer.get_extra_info('socket').fileno()))
+
+async def take_buffered(reader: asyncio.StreamReader) -> bytes:
+    """Return whatever reader buffered before its transport was paused"""
+    # Marking the stream finished lets read() hand back the buffer without
+    # waiting; the socket itself is read directly from here on. Reading can
+    # resume a transport the reader paused for flow control, so callers must
+    # pause it again before yielding to the event loop.
+    reader.feed_eof()
+    return await reader.read()
+
+async def wait_fd(fd: int, writable: bool = False):
+    """Wait until fd is readable (or writable)"""
+    loop = asyncio.get_running_loop()
+    waiter = loop.create_future()
+    add, remove = (loop.add_writer, loop.remove_writer) if writable else (loop.add_reader, loop.remove_reader)
+    add(fd, lambda: waiter.done() or waiter.set_result(None))
+    try:
+        await waiter
+    finally:
+        remove(fd)
+
+def _shutdown(sock: socket.socket):
+    """Tear down sock so the pump in the opposite direction ends too"""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+async def splice_data(src: socket.socket, dst: socket.socket, direction: str):
+    """Move data from src to dst until EOF without copying it into Python"""
+    flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+    pipe_r, pipe_w = os.pipe()
+    try:
+        while True:
+            try:
+                pending = os.splice(src.fileno(), pipe_w, 1 << 16, flags=flags)
+            except BlockingIOError:
+                await wait_fd(src.fileno())
+                continue
+            if not pending:
+                break
+            
+            while pending:
+                try:
+                    pending -= os.splice(pipe_r, dst.fileno(), pending, flags=flags)
+                except BlockingIOError:
+                    await wait_fd(dst.fileno(), writable=True)
+    except Exception as e:
+        logger.debug(f"Relay error ({direction}): {e}")
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+        _shutdown(dst)
+
+async def recv_into_data(src: socket.socket, dst: socket.socket, direction: str):
+    """Copy data from src to dst until EOF through one reused buffer"""
+    loop = asyncio.get_running_loop()
+    view = memoryview(bytearray(65536))
+    try:
+        while True:
+            n = await loop.sock_recv_into(src, view)
+            if not n:
+                break
+            await loop.sock_sendall(dst, view[:n])
+    except Exception as e:
+        logger.debug(f"Relay error ({direction}): {e}")
+    finally:
+        _shutdown(dst)
@@ -4,206 +4,163 @@ Comprehensive SOCKS5 proxy data flow test
 Tests actual data transmission through the proxy
 """
 
-import socket
-import struct
+import asyncio
+import functools
 import sys
 import os
 import time
 import threading
 import ssl
 
+from socks5 import Socks5Client
+
+CONFIG_FILE = "config/proxy.env"
+
+@functools.lru_cache(maxsize=1)
+def _parse_config(mtime_ns):
+    """Parse proxy.env; cached per modification time so edits are picked up"""
+    with open(CONFIG_FILE, 'r') as f:
+        lines = (line.strip() for line in f)
+        pairs = (line.split('=', 1) for line in lines
+                 if line and not line.startswith('#') and '=' in line)
+        return {key.strip(): value.strip() for key, value in pairs}
+
 def load_config():
     """Load configuration from proxy.env file"""
-    config = {}
-    config_file = "config/proxy.env"
+    try:
+        mtime_ns = os.stat(CONFIG_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    return dict(_parse_config(mtime_ns))
+
+def _http_request(host, path, keep_alive=False):
+    """Build an HTTP GET request"""
+    connection = "keep-alive" if keep_alive else "close"
+    return f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: {connection}\r\nUser-Agent: SOCKS5-Test/1.0\r\n\r\n".encode()
+
+async def _read_http_response(reader):
+    """Read one HTTP response framed by Content-Length or chunked encoding"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.split(b'\r\n')
+    status = lines[0].split()
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(b':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
     
-    if os.path.exists(config_file):
-        with open(config_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    config[key.strip()] = value.strip()
+    # Informational, 204 and 304 responses carry no body
+    if len(status) > 1 and (status[1].startswith(b'1') or status[1] in (b'204', b'304')):
+        return head
     
-    return config
+    if b'chunked' in headers.get(b'transfer-encoding', b'').lower():
+        body = bytearray()
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            if not size:
+                # Skip any trailers up to the final blank line
+                while await reader.readuntil(b'\r\n') != b'\r\n':
+                    pass
+                return head + bytes(body)
+            body += (await reader.readexactly(size + 2))[:-2]
+    
+    if b'content-length' in headers:
+        return head + await reader.readexactly(int(headers[b'content-length']))
+    return head + await reader.read()
 
-def socks5_connect(proxy_host, proxy_port, target_host, target_port, username=None, password=None):
-    """Establish SOCKS5 connection and return the socket"""
-    try:
-        # Create socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(10)
-        
-        print(f" Connecting to SOCKS5 proxy at {proxy_host}:{proxy_port}...")
-        sock.connect((proxy_host, proxy_port))
-        
-        # SOCKS5 handshake
-        if username and password:
-            handshake = struct.pack('!BBB', 5, 1, 2)  # Version 5, 1 method, username/password
+def _check_response(response):
+    """Report an HTTP response; returns True if one was received"""
+    if response:
+        status_line = bytes(response.split(b'\n', 1)[0]).decode('utf-8', errors='ignore')
+        
+        print(f" Received response: {status_line.strip()}")
+        print(f" Data received: {len(response)} bytes")
+        
+        # Look for common HTTP status codes
+        if "200 OK" in status_line:
+            print(" HTTP 200 OK - Request successful")
+            return True
+        elif "301" in status_line or "302" in status_line:
+            print(" HTTP Redirect - Request successful")
+            return True
+        elif "403" in status_line:
+            print(" HTTP 403 Forbidden - Connection working but access denied")
+            return True
         else:
-            handshake = struct.pack('!BBB', 5, 1, 0)  # Version 5, 1 method, no auth
-        
-        sock.send(handshake)
-        response = sock.recv(2)
-        
-        if len(response) != 2:
-            raise Exception("Invalid handshake response")
-        
-        version, method = struct.unpack('!BB', response)
-        
-        if version != 5:
-            raise Exception(f"Invalid SOCKS version: {version}")
-        
-        if method == 0xFF:
-            raise Exception("No acceptable authentication method")
-        
-        print(f" SOCKS5 handshake successful (method: {method})")
-        
-        # Handle authentication if required
-        if method == 2:  # Username/password authentication
-            if not username or not password:
-                raise Exception("Authentication required but no credentials provided")
-            
-            print(" Performing authentication...")
-            auth_request = struct.pack('!BB', 1, len(username)) + username.encode()
-            auth_request += struct.pack('!B', len(password)) + password.encode()
-            
-            sock.send(auth_request)
-            auth_response = sock.recv(2)
-            
-            if len(auth_response) != 2:
-                raise Exception("Invalid authentication response")
-            
-            auth_version, auth_status = struct.unpack('!BB', auth_response)
-            
-            if auth_status != 0:
-                raise Exception("Authentication failed")
-            
-            print(" Authentication successful")
-        
-        # Connect to target through proxy
-        print(f" Connecting to {target_host}:{target_port} through proxy...")
-        
-        # SOCKS5 connect request
-        request = struct.pack('!BBB', 5, 1, 0)  # Version, connect, reserved
-        request += struct.pack('!B', 3)  # Domain name type
-        request += struct.pack('!B', len(target_host)) + target_host.encode()
-        request += struct.pack('!H', target_port)
-        
-        sock.send(request)
-        connect_response = sock.recv(10)
-        
-        if len(connect_response) < 10:
-            raise Exception("Invalid connect response")
-        
-        response_version, response_code = struct.unpack('!BB', connect_response[:2])
-        
-        if response_version != 5:
-            raise Exception(f"Invalid response version: {response_version}")
-        
-        if response_code != 0:
-            error_messages = {
-                1: "General SOCKS server failure",
-                2: "Connection not allowed by ruleset",
-                3: "Network unreachable",
-                4: "Host unreachable",
-                5: "Connection refused",
-                6: "TTL expired",
-                7: "Command not supported",
-                8: "Address type not supported"
-            }
-            error_msg = error_messages.get(response_code, f"Unknown error code: {response_code}")
-            raise Exception(f"SOCKS5 connection failed: {error_msg}")
-        
-        print(f" Successfully connected to {target_host}:{target_port}")
-        return sock
-        
-    except Exception as e:
-        if 'sock' in locals():
-            sock.close()
-        raise e
+            print(f" HTTP Response: {status_line.strip()}")
+            return True
+    else:
+        print(" No response received")
+        return False
 
-def test_http_request(sock, host, path="/"):
+async def test_http_request(reader, writer, host, path="/"):
     """Send HTTP request and receive response through SOCKS5"""
     try:
         # Send HTTP GET request
-        http_request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\nUser-Agent: SOCKS5-Test/1.0\r\n\r\n"
-        
         print(f" Sending HTTP request to {host}{path}...")
-        sock.send(http_request.encode())
+        writer.write(_http_request(host, path))
+        await writer.drain()
         
-        # Receive response
+        # Receive response; stop at the end of the body rather than waiting for the close
         print("📥 Receiving response...")
-        response = b""
-        start_time = time.time()
-        
-        while True:
-            try:
-                data = sock.recv(4096)
-                if not data:
-                    break
-                response += data
-                
-                # Timeout after 10 seconds
-                if time.time() - start_time > 10:
-                    break
-                    
-            except socket.timeout:
-                break
+        try:
+            response = await asyncio.wait_for(_read_http_response(reader), timeout=10)
+        except asyncio.IncompleteReadError as e:
+            response = e.partial
+        except asyncio.TimeoutError:
+            response = b''
         
-        if response:
-            response_str = response.decode('utf-8', errors='ignore')
-            lines = response_str.split('\n')
-            status_line = lines[0] if lines else "No response"
-            
-            print(f" Received response: {status_line.strip()}")
-            print(f" Data received: {len(response)} bytes")
-            
-            # Look for common HTTP status codes
-            if "200 OK" in status_line:
-                print(" HTTP 200 OK - Request successful")
-                return True
-            elif "301" in status_line or "302" in status_line:
-                print(" HTTP Redirect - Request successful")
-                return True
-            elif "403" in status_line:
-                print(" HTTP 403 Forbidden - Connection working but access denied")
-                return True
-            else:
-                print(f" HTTP Response: {status_line.strip()}")
-                return True
-        else:
-            print(" No response received")
-            return False
+        return _check_response(response)
             
     except Exception as e:
         print(f" HTTP request failed: {e}")
         return False
 
-def test_telegram_api(proxy_host, proxy_port, username, password):
+async def test_http_pipeline(reader, writer, host, paths):
+    """Pipeline GET requests for paths over one keep-alive connection; returns a result per path"""
+    # Every request but the last keeps the connection open
+    print(f" Sending {len(paths)} pipelined HTTP requests to {host}...")
+    writer.write(b''.join(_http_request(host, path, keep_alive=index < len(paths) - 1)
+                          for index, path in enumerate(paths)))
+    await writer.drain()
+    
+    results = []
+    for path in paths:
+        print(f"📥 Receiving response for {host}{path}...")
+        try:
+            response = await asyncio.wait_for(_read_http_response(reader), timeout=10)
+        except Exception as e:
+            print(f" HTTP request failed: {e}")
+            # A broken response leaves the rest of the pipeline unreadable
+            results += [False] * (len(paths) - len(results))
+            break
+        results.append(_check_response(response))
+    return results
+
+async def test_telegram_api(client):
     """Test actual Telegram API access through proxy"""
     print("\n Testing Telegram API access...")
     
     try:
         # Connect to Telegram API
-        sock = socks5_connect(proxy_host, proxy_port, "api.telegram.org", 443, username, password)
+        reader, writer = await client.connect("api.telegram.org", 443)
         
-        # Wrap in SSL
+        # Upgrade to SSL
         print(" Establishing SSL connection...")
         context = ssl.create_default_context()
-        ssl_sock = context.wrap_socket(sock, server_hostname="api.telegram.org")
+        await writer.start_tls(context, server_hostname="api.telegram.org")
         
         # Test HTTP request to Telegram API
-        success = test_http_request(ssl_sock, "api.telegram.org", "/")
+        success = await test_http_request(reader, writer, "api.telegram.org", "/")
         
-        ssl_sock.close()
+        writer.close()
         return success
         
     except Exception as e:
         print(f" Telegram API test failed: {e}")
         return False
 
-def test_web_access(proxy_host, proxy_port, username, password):
+async def test_web_access(client):
     """Test general web access through proxy"""
     print("\n Testing general web access...")
     
@@ -212,37 +169,43 @@ def test_web_access(proxy_host, proxy_port, username, password):
         ("ifconfig.me", 80, "/"),
     ]
     
+    # One keep-alive tunnel per origin serves all of its paths
+    origins = {}
+    for host, port, path in test_sites:
+        origins.setdefault((host, port), []).append(path)
+    
     success_count = 0
     
-    for host, port, path in test_sites:
+    for (host, port), paths in origins.items():
         try:
-            print(f"\n Testing {host}{path}...")
-            sock = socks5_connect(proxy_host, proxy_port, host, port, username, password)
+            print(f"\n Testing {host} ({', '.join(paths)})...")
+            reader, writer = await client.connect(host, port)
             
-            if test_http_request(sock, host, path):
-                success_count += 1
-                print(f" {host} test successful")
-            else:
-                print(f" {host} test failed")
+            for path, success in zip(paths, await test_http_pipeline(reader, writer, host, paths)):
+                if success:
+                    success_count += 1
+                    print(f" {host}{path} test successful")
+                else:
+                    print(f" {host}{path} test failed")
             
-            sock.close()
+            writer.close()
             
         except Exception as e:
             print(f" {host} test failed: {e}")
     
     return success_count > 0
 
-def test_data_throughput(proxy_host, proxy_port, username, password):
+async def test_data_throughput(client):
     """Test data throughput through proxy"""
     print("\n Testing data throughput...")
     
     try:
         # Connect to a site that returns JSON data
-        sock = socks5_connect(proxy_host, proxy_port, "httpbin.org", 80, username, password)
+        reader, writer = await client.connect("httpbin.org", 80)
         
         # Request JSON data
         start_time = time.time()
-        success = test_http_request(sock, "httpbin.org", "/json")
+        success = await test_http_request(reader, writer, "httpbin.org", "/json")
         end_time = time.time()
         
         if success:
@@ -250,13 +213,47 @@ def test_data_throughput(proxy_host, proxy_port, username, password):
             print(f" Request completed in {duration:.2f} seconds")
             print(" Data throughput test successful")
         
-        sock.close()
+        writer.close()
         return success
         
     except Exception as e:
         print(f" Throughput test failed: {e}")
         return False
 
+async def test_concurrent_connections(client):
+    """Test several requests through the proxy at the same time"""
+    print("\n Testing multiple concurrent connections...")
+    
+    async def fetch(host, path):
+        reader, writer = await client.connect(host, 80)
+        try:
+            return await test_http_request(reader, writer, host, path)
+        finally:
+            writer.close()
+    
+    try:
+        success1, success2 = await asyncio.gather(fetch("httpbin.org", "/uuid"),
+                                                  fetch("ifconfig.me", "/"))
+        
+        if success1 and success2:
+            print(" Multiple connections test successful")
+            return True
+        else:
+            print(" Multiple connections test failed")
+            
+    except Exception as e:
+        print(f" Multiple connections test failed: {e}")
+    return False
+
+async def run_tests(client):
+    """Run every data flow test on one event loop; returns the number passed"""
+    tests = (test_telegram_api, test_web_access, test_data_throughput, test_concurrent_connections)
+    tests_passed = 0
+    for test in tests:
+        if await test(client):
+            tests_passed += 1
+    return tests_passed
+
 def main():
     """Main test function"""
     print("╔══════════════════════════════════════════════════════════════════════════════╗")
@@ -281,41 +278,10 @@ def main():
     print(f"   Password: {'*' * len(password) if password else 'None'}")
     print(f"\n{'='*80}")
     
-    tests_passed = 0
-    total_tests = 4
-    
-    # Test 1: Telegram API access
-    if test_telegram_api(proxy_host, proxy_port, username, password):
-        tests_passed += 1
-    
-    # Test 2: General web access
-    if test_web_access(proxy_host, proxy_port, username, password):
-        tests_passed += 1
+    client = Socks5Client(proxy_host, proxy_port, username, password, log=print)
     
-    # Test 3: Data throughput
-    if test_data_throughput(proxy_host, proxy_port, username, password):
-        tests_passed += 1
-    
-    # Test 4: Multiple connections
-    print("\n Testing multiple concurrent connections...")
-    try:
-        sock1 = socks5_connect(proxy_host, proxy_port, "httpbin.org", 80, username, password)
-        sock2 = socks5_connect(proxy_host, proxy_port, "ifconfig.me", 80, username, password)
-        
-        success1 = test_http_request(sock1, "httpbin.org", "/uuid")
-        success2 = test_http_request(sock2, "ifconfig.me", "/")
-        
-        sock1.close()
-        sock2.close()
-        
-        if success1 and success2:
-            print(" Multiple connections test successful")
-            tests_passed += 1
-        else:
-            print(" Multiple connections test failed")
-            
-    except Exception as e:
-        print(f" Multiple connections test failed: {e}")
+    total_tests = 4
+    tests_passed = asyncio.run(run_tests(client))
     
     # Final results
     print(f"\n{'='*80}")
@@ -3,156 +3,123 @@
 Test script for Telegram SOCKS5 proxy connection
 """
 
-import socket
-import struct
+import asyncio
+import functools
 import sys
 import os
 import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def test_socks5_connection(host, port, username=None, password=None):
+from socks5 import Socks5Client, Socks5ReplyError
+
+async def test_socks5_connection(host, port, username=None, password=None):
     """Test SOCKS5 proxy connection"""
+    client = Socks5Client(host, port, username, password, log=print)
     try:
-        # Create socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(10)
-        
-        print(f"Connecting to SOCKS5 proxy at {host}:{port}...")
-        sock.connect((host, port))
-        
-        # SOCKS5 handshake
-        if username and password:
-            # Request username/password authentication
-            handshake = struct.pack('!BBB', 5, 1, 2)  # Version 5, 1 method, username/password
-        else:
-            # Request no authentication
-            handshake = struct.pack('!BBB', 5, 1, 0)  # Version 5, 1 method, no auth
-        
-        sock.send(handshake)
-        response = sock.recv(2)
-        
-        if len(response) != 2:
-            print(" Invalid handshake response")
-            return False
-        
-        version, method = struct.unpack('!BB', response)
-        
-        if version != 5:
-            print(f"Invalid SOCKS version: {version}")
-            return False
-        
-        if method == 0xFF:
-            print(" No acceptable authentication method")
-            return False
-        
-        print(f" Handshake successful (method: {method})")
-        
-        # Handle authentication if required
-        if method == 2:  # Username/password authentication
-            if not username or not password:
-                print(" Authentication required but no credentials provided")
-                return False
-            
-            print(" Performing authentication...")
-            auth_request = struct.pack('!BB', 1, len(username)) + username.encode()
-            auth_request += struct.pack('!B', len(password)) + password.encode()
-            
-            sock.send(auth_request)
-            auth_response = sock.recv(2)
-            
-            if len(auth_response) != 2:
-                print(" Invalid authentication response")
-                return False
-            
-            auth_version, auth_status = struct.unpack('!BB', auth_response)
-            
-            if auth_status != 0:
-                print(" Authentication failed")
-                return False
-            
-            print(" Authentication successful")
-        
         # Try to connect to a test Telegram server
-        print(" Testing connection to Telegram servers...")
-        test_host = "api.telegram.org"
-        test_port = 443
-        
-        # SOCKS5 connect request
-        request = struct.pack('!BBB', 5, 1, 0)  # Version, connect, reserved
-        request += struct.pack('!B', 3)  # Domain name type
-        request += struct.pack('!B', len(test_host)) + test_host.encode()
-        request += struct.pack('!H', test_port)
-        
-        sock.send(request)
-        connect_response = sock.recv(10)
-        
-        if len(connect_response) < 10:
-            print(" Invalid connect response")
-            return False
-        
-        response_version, response_code = struct.unpack('!BB', connect_response[:2])
-        
-        if response_version != 5:
-            print(f" Invalid response version: {response_version}")
-            return False
-        
-        if response_code == 0:
-            print(" Successfully connected to Telegram servers!")
-            print(" Your SOCKS5 proxy is working correctly!")
-            return True
-        elif response_code == 2:
+        reader, writer = await client.connect("api.telegram.org", 443)
+        writer.close()
+        print(" Successfully connected to Telegram servers!")
+        print(" Your SOCKS5 proxy is working correctly!")
+        return True
+    
+    except Socks5ReplyError as e:
+        if e.code == 2:
             print(" Connection not allowed by ruleset (this is expected - proxy is secure)")
             print(" SOCKS5 proxy is working but blocking non-Telegram traffic (secure mode)")
             return True
-        else:
-            print(f" Connection failed with code: {response_code}")
-            return False
-    
+        print(f" Connection failed with code: {e.code}")
+        return False
     except Exception as e:
         print(f" Connection test failed: {e}")
         return False
-    finally:
-        sock.close()
+
+CONFIG_FILE = "config/proxy.env"
+
+@functools.lru_cache(maxsize=1)
+def _parse_config(mtime_ns):
+    """Parse proxy.env; cached per modification time so edits are picked up"""
+    with open(CONFIG_FILE, 'r') as f:
+        lines = (line.strip() for line in f)
+        pairs = (line.split('=', 1) for line in lines
+                 if line and not line.startswith('#') and '=' in line)
+        return {key.strip(): value.strip() for key, value in pairs}
 
 def load_config():
     """Load configuration from proxy.env file"""
-    config = {}
-    config_file = "config/proxy.env"
-    
-    if os.path.exists(config_file):
-        with open(config_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    config[key.strip()] = value.strip()
-    
-    return config
+    try:
+        mtime_ns = os.stat(CONFIG_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    return dict(_parse_config(mtime_ns))
 
-def get_server_ip():
-    """Get the server's public IP address"""
+IP_PROBE_URLS = ['http://ifconfig.me', 'http://ipinfo.io/ip', 'http://icanhazip.com']
+IP_CACHE_FILE = "/tmp/.proxy_ip_cache"
+IP_CACHE_TTL = 60  # seconds
+
+def _probe_ip(url):
+    """Ask one IP detection service for our public address"""
+    import urllib.request
+    with urllib.request.urlopen(url, timeout=5) as response:
+        ip = response.read().decode().strip()
+    return ip if ip and '.' in ip else None
+
+def _probe_public_ip():
+    """Query all IP detection services at once and return the first answer"""
+    executor = ThreadPoolExecutor(len(IP_PROBE_URLS))
+    futures = [executor.submit(_probe_ip, url) for url in IP_PROBE_URLS]
     try:
-        # Try multiple IP detection services
-        for url in ['http://ifconfig.me', 'http://ipinfo.io/ip', 'http://icanhazip.com']:
+        for future in as_completed(futures, timeout=5):
             try:
-                import urllib.request
-                with urllib.request.urlopen(url, timeout=5) as response:
-                    ip = response.read().decode().strip()
-                    if ip and '.' in ip:
-                        return ip
+                ip = future.result()
             except:
                 continue
-        
-        # Fallback to hostname -I
-        import subprocess
-        result = subprocess.run(['hostname', '-I'], capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            ip = result.stdout.strip().split()[0]
-            if ip and '.' in ip:
+            if ip:
                 return ip
-    except:
+    except TimeoutError:
+        pass
+    finally:
+        # Don't wait for the slower services
+        executor.shutdown(wait=False, cancel_futures=True)
+    return None
+
+def get_server_ip():
+    """Get the server's public IP address"""
+    # Reuse a recent answer so repeated runs skip the network
+    try:
+        if time.time() - os.path.getmtime(IP_CACHE_FILE) < IP_CACHE_TTL:
+            with open(IP_CACHE_FILE) as f:
+                ip = f.read().strip()
+            if ip:
+                return ip
+    except OSError:
         pass
     
-    return 'localhost'
+    ip = None
+    try:
+        ip = _probe_public_ip()
+        
+        if not ip:
+            # Fallback to hostname -I
+            import subprocess
+            result = subprocess.run(['hostname', '-I'], capture_output=True, text=True, timeout=5)
+            if result.returncode == 0:
+                ip = result.stdout.strip().split()[0]
+                if not (ip and '.' in ip):
+                    ip = None
+    except:
+        ip = None
+    
+    if not ip:
+        return 'localhost'
+    
+    try:
+        with open(IP_CACHE_FILE, 'w') as f:
+            f.write(ip)
+    except OSError:
+        pass
+    return ip
 
 def main():
     parser = argparse.ArgumentParser(description='Test Telegram SOCKS5 proxy connection')
@@ -194,7 +161,7 @@ def main():
     print(f"Password: {'*' * len(args.password) if args.password else 'None'}")
     print("=" * 45)
     
-    success = test_socks5_connection(args.host, args.port, args.username, args.password)
+    success = asyncio.run(test_socks5_connection(args.host, args.port, args.username, args.password))
     
     if success:
         print("")
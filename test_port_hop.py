@@ -1,80 +1,189 @@
 #!/usr/bin/env python3
+import argparse
 import asyncio
 import struct
-import aiohttp
-import json
+import sys
+import time
 
-async def get_current_port():
-    """Get current active port from bypass server"""
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Precompiled SOCKS5 message formats
+_B = struct.Struct('!B')
+_BB = struct.Struct('!BB')
+_BBB = struct.Struct('!BBB')
+
+USERNAME = 'admin'
+PASSWORD = 'PD1pF60k5H21ERb4z96uoflJtN612QyD'
+
+def _auth_frame(username, password):
+    """Username/password auth frame: version, ulen, username, plen, password"""
+    user_bytes = username.encode()
+    pass_bytes = password.encode()
+    frame = bytearray(3 + len(user_bytes) + len(pass_bytes))
+    _BB.pack_into(frame, 0, 1, len(user_bytes))
+    frame[2:2 + len(user_bytes)] = user_bytes
+    _B.pack_into(frame, 2 + len(user_bytes), len(pass_bytes))
+    frame[3 + len(user_bytes):] = pass_bytes
+    return bytes(frame)
+
+# The credentials are fixed, so both frames are built once at import
+_GREET_USERPASS = _BBB.pack(5, 1, 2)  # Version 5, 1 method, username/password
+_AUTH_REQUEST = _auth_frame(USERNAME, PASSWORD)
+_METHOD_USERPASS = 0x0502  # Method reply: version 5, username/password selected
+
+DRAIN_THRESHOLD = 16384  # bytes
+
+PORT_CACHE_TTL = 1.0  # seconds
+
+_PORT_CACHE = None  # (port, time fetched)
+_PORT_LOCK = asyncio.Lock()
+
+# Numeric address: the bypass server listens on IPv4 and a literal skips the
+# getaddrinfo() call that asyncio would otherwise run in its thread pool
+BYPASS_HOST = '127.0.0.1'
+PORT_INFO_PORT = 8443
+PORT_INFO_TIMEOUT = 2  # seconds
+_PORT_INFO_REQUEST = b"GET /port-info HTTP/1.0\r\nHost: localhost:8443\r\n\r\n"
+
+async def _fetch_port_info():
+    """GET /port-info over a plain stream; returns the decoded JSON or None"""
+    reader, writer = await asyncio.open_connection(BYPASS_HOST, PORT_INFO_PORT)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("http://localhost:8443/port-info") as response:
-                if response.status == 200:
-                    port_info = await response.json()
-                    return port_info.get('current_port')
-    except Exception as e:
-        print(f"Failed to get port info: {e}")
+        writer.write(_PORT_INFO_REQUEST)
+        head = await reader.readuntil(b"\r\n\r\n")
+        if head.split(None, 2)[1:2] != [b"200"]:
+            return None
+        
+        length = None
+        for line in head.split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                length = int(value)
+        body = await reader.readexactly(length) if length is not None else await reader.read()
+    finally:
+        writer.close()
+    return json_loads(body)
+
+async def _send(writer, data):
+    """Write data, only waiting on drain() once the transport buffer is backed up"""
+    writer.write(data)
+    if writer.transport.get_write_buffer_size() > DRAIN_THRESHOLD:
+        await writer.drain()
+
+async def get_current_port():
+    """Get current active port from bypass server, reusing an answer younger than PORT_CACHE_TTL"""
+    global _PORT_CACHE
+    async with _PORT_LOCK:
+        if _PORT_CACHE and time.monotonic() - _PORT_CACHE[1] < PORT_CACHE_TTL:
+            return _PORT_CACHE[0]
+        try:
+            port_info = await asyncio.wait_for(_fetch_port_info(), timeout=PORT_INFO_TIMEOUT)
+            if port_info:
+                current_port = port_info.get('current_port')
+                if current_port:
+                    _PORT_CACHE = (current_port, time.monotonic())
+                return current_port
+        except Exception as e:
+            print(f"Failed to get port info: {e}")
     return None
 
+def forget_current_port():
+    """Drop the cached port, e.g. after the server has hopped away from it"""
+    global _PORT_CACHE
+    _PORT_CACHE = None
+
 async def test_port_hop():
+    # Collect the report and write it in one go, so concurrent runs don't interleave
+    lines = []
+    log = lines.append
     try:
         # Get current active port
         current_port = await get_current_port()
         if not current_port:
-            print("✗ Could not get current port from bypass server")
+            log("✗ Could not get current port from bypass server")
             return
             
-        print(f"Testing port hopping connection to port {current_port}...")
-        reader, writer = await asyncio.open_connection('localhost', current_port)
-        print("✓ Connected to port hopping server")
+        log(f"Testing port hopping connection to port {current_port}...")
+        try:
+            reader, writer = await asyncio.open_connection(BYPASS_HOST, current_port)
+        except OSError:
+            # The cached port may be stale; ask the server again and retry once
+            forget_current_port()
+            current_port = await get_current_port()
+            if not current_port:
+                log("✗ Could not get current port from bypass server")
+                return
+            log(f"Retrying on port {current_port}...")
+            reader, writer = await asyncio.open_connection(BYPASS_HOST, current_port)
+        log("✓ Connected to port hopping server")
         
-        # SOCKS5 handshake
-        handshake = struct.pack('!BBB', 5, 1, 2)
-        writer.write(handshake)
-        await writer.drain()
-        
-        response = await reader.read(2)
-        print(f"Handshake response: {response}")
-        
-        if len(response) == 2:
-            version, method = struct.unpack('!BB', response)
-            print(f"SOCKS5 version: {version}, method: {method}")
+        try:
+            # SOCKS5 handshake
+            await _send(writer, _GREET_USERPASS)
+            
+            try:
+                response = await reader.readexactly(2)
+            except asyncio.IncompleteReadError:
+                log("✗ No handshake response")
+                return
+            log(f"Handshake response: {response}")
             
-            if version == 5 and method == 2:
-                print("✓ SOCKS5 handshake successful")
-                
-                # Try authentication
-                username = 'admin'
-                password = 'PD1pF60k5H21ERb4z96uoflJtN612QyD'
-                
-                auth_request = struct.pack('!BB', 1, len(username)) + username.encode()
-                auth_request += struct.pack('!B', len(password)) + password.encode()
-                
-                writer.write(auth_request)
-                await writer.drain()
-                
-                auth_response = await reader.read(2)
-                print(f"Auth response: {auth_response}")
-                
-                if len(auth_response) == 2:
-                    version, status = struct.unpack('!BB', auth_response)
-                    if status == 0:
-                        print("✓ Authentication successful!")
-                        print("✓ Port hopping bypass method is working!")
-                    else:
-                        print(f"✗ Authentication failed: {status}")
-                else:
-                    print("✗ Invalid auth response")
+            log(f"SOCKS5 version: {response[0]}, method: {response[1]}")
+            
+            # Version and method checked together as one 16-bit value
+            if int.from_bytes(response, 'big') != _METHOD_USERPASS:
+                log("✗ Invalid SOCKS5 handshake")
+                return
+            log("✓ SOCKS5 handshake successful")
+            
+            # Try authentication
+            await _send(writer, _AUTH_REQUEST)
+            
+            try:
+                auth_response = await reader.readexactly(2)
+            except asyncio.IncompleteReadError:
+                log("✗ Invalid auth response")
+                return
+            log(f"Auth response: {auth_response}")
+            
+            status = auth_response[1]
+            if status == 0:
+                log("✓ Authentication successful!")
+                log("✓ Port hopping bypass method is working!")
             else:
-                print("✗ Invalid SOCKS5 handshake")
-        else:
-            print("✗ No handshake response")
-        
-        writer.close()
-        await writer.wait_closed()
+                log(f"✗ Authentication failed: {status}")
+        finally:
+            writer.close()
+            await writer.wait_closed()
         
     except Exception as e:
-        print(f"✗ Test failed: {e}")
+        log(f"✗ Test failed: {e}")
+    finally:
+        sys.stdout.write("\n".join(lines) + "\n")
+
+async def main(concurrency=1, runs=1):
+    # All runs share one event loop, so the port cache carries over
+    for _ in range(runs):
+        # Overlap the round trips of the concurrent connections
+        await asyncio.gather(*(test_port_hop() for _ in range(concurrency)))
 
 if __name__ == "__main__":
-    asyncio.run(test_port_hop()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Test the port hopping bypass server')
+    parser.add_argument('-n', '--concurrency', type=int, default=1,
+                        help='Number of connections to test at once (default: 1)')
+    parser.add_argument('-r', '--runs', type=int, default=1,
+                        help='Number of times to repeat the test (default: 1)')
+    args = parser.parse_args()
+    
+    # Use uvloop for lower per-connection overhead when it is installed
+    if uvloop is not None:
+        uvloop.install()
+    asyncio.run(main(args.concurrency, args.runs)) 
\ No newline at end of file
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Relay regression tests for the SOCKS5 proxy (python -m unittest discover tests)
+"""
+
+import asyncio
+import os
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import main
+from relay import SPLICE_AVAILABLE
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+async def _echo(reader, writer):
+    while data := await reader.read(65536):
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+async def _relay_early_data(relay_backend):
+    """Send a CONNECT pipelined with data well past the stream limit; return what echoes back"""
+    echo_server = await asyncio.start_server(_echo, '127.0.0.1', 0)
+    echo_port = echo_server.sockets[0].getsockname()[1]
+
+    config = main.ProxyConfig(auth_required=False, telegram_cidrs=('127.0.0.0/8',),
+                              relay_backend=relay_backend)
+    server = main.SOCKS5Server(config)
+
+    # Hold the target connect back so the client's data piles up in the
+    # proxy's stream buffer and pauses its transport
+    open_target = server._open_target
+    async def slow_open_target(addr, port):
+        await asyncio.sleep(0.2)
+        return await open_target(addr, port)
+    server._open_target = slow_open_target
+
+    proxy = await asyncio.start_server(server.handle_client, '127.0.0.1', 0,
+                                       limit=config.max_connections)
+    proxy_port = proxy.sockets[0].getsockname()[1]
+
+    payload = bytes(range(256)) * 800  # 200 KiB, far more than 2 * limit
+    reader, writer = await asyncio.open_connection('127.0.0.1', proxy_port)
+    try:
+        writer.write(b'\x05\x01\x00' + b'\x05\x01\x00\x01' + bytes([127, 0, 0, 1])
+                     + struct.pack('!H', echo_port) + payload)
+        await writer.drain()
+        await reader.readexactly(2 + 10)  # method selection and IPv4 CONNECT reply
+
+        received = b''
+        while len(received) < len(payload):
+            data = await asyncio.wait_for(reader.read(65536), timeout=5)
+            if not data:
+                break
+            received += data
+        return payload, received
+    finally:
+        writer.close()
+        await writer.wait_closed()
+        # Let the relay and echo handlers see the close and finish
+        await asyncio.sleep(0.1)
+        proxy.close()
+        echo_server.close()
+        await proxy.wait_closed()
+        await echo_server.wait_closed()
+
+class EarlyDataRelayTest(unittest.TestCase):
+    """Client data sent before the CONNECT reply must reach the target intact"""
+
+    def _check(self, relay_backend, loop_factory=None):
+        with asyncio.Runner(loop_factory=loop_factory) as runner:
+            payload, received = runner.run(_relay_early_data(relay_backend))
+        self.assertEqual(len(received), len(payload))
+        self.assertEqual(received, payload)
+
+    def test_copy_relay(self):
+        self._check('copy')
+
+    @unittest.skipUnless(SPLICE_AVAILABLE, "splice(2) not available")
+    def test_splice_relay(self):
+        self._check('splice')
+
+    @unittest.skipIf(uvloop is None, "uvloop not installed")
+    def test_copy_relay_uvloop(self):
+        self._check('copy', uvloop.new_event_loop)
+
+    @unittest.skipUnless(SPLICE_AVAILABLE and uvloop, "splice(2) or uvloop not available")
+    def test_splice_relay_uvloop(self):
+        self._check('splice', uvloop.new_event_loop)
+
+if __name__ == '__main__':
+    unittest.main()